@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the JSON decoding backends available to JsonWalker.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_decoders [count]
+"""
+
+from benchmarks.synthetic import make_tree
+import logging
+from pleiades.walker.decoders import available_decoders
+from pleiades.walker.entities import INDEX_KEYS
+from pleiades.walker.walker import PleiadesWalker
+from shutil import rmtree
+import sys
+from tempfile import mkdtemp
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNT = 36000
+
+
+def main(count=DEFAULT_COUNT):
+    path = make_tree(mkdtemp(), count)
+    try:
+        for decoder in available_decoders():
+            for keys in [None, INDEX_KEYS]:
+                w = PleiadesWalker(path=path, decoder=decoder, keys=keys)
+                start = perf_counter()
+                n, pc = w.walk()
+                elapsed = perf_counter() - start
+                print('{:10} {:10} {:6d} files {:8.2f} s {:10.0f} files/s'.format(
+                    decoder, 'projected' if keys else 'full', n, elapsed,
+                    n / elapsed))
+    finally:
+        rmtree(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure fuzzy name search latency as the vocabulary grows.
+
+NameSearchIndex.similar() is timed over vocabularies of synthetic name
+tokens of increasing size, with and without a limit, against a scan of the
+postings of every trigram of the query (which is how candidates were found
+before length and overlap filtering).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_fuzzy [largest vocabulary size]
+"""
+
+from benchmarks.synthetic import make_name
+import logging
+from pleiades.walker.entities import NameSearchIndex, _trigrams
+from random import Random
+import sys
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 400000
+QUERIES = 200
+LIMIT = 10
+THRESHOLD = 0.3
+
+
+def make_index(size: int, rng: Random):
+    """Return a NameSearchIndex of size distinct synthetic tokens, and
+    their postings by trigram alone, for scan()."""
+    index = NameSearchIndex()
+    flat = {}
+    while len(index) < size:
+        word = make_name(rng).split()[0].lower()
+        # a suffix makes rarer tokens, as in a real gazetteer
+        if rng.random() < 0.5:
+            word += make_name(rng).split()[0].lower()
+        if word in index.terms:
+            continue
+        index.add([word], len(index))
+        for gram in _trigrams(word):
+            flat.setdefault(gram, []).append(word)
+    return index, flat
+
+
+def scan(flat: dict, token: str, threshold: float):
+    """Score every token sharing a trigram with token."""
+    grams = _trigrams(token)
+    shared = {}
+    for gram in grams:
+        for term in flat.get(gram, []):
+            shared[term] = shared.get(term, 0) + 1
+    scored = []
+    for term, count in shared.items():
+        score = 2.0 * count / (len(grams) + len(term) + 1)
+        if score >= threshold:
+            scored.append((-score, term))
+    scored.sort()
+    return scored
+
+
+def main(largest=DEFAULT_SIZE):
+    rng = Random(1)
+    queries = [make_name(rng).split()[0].lower() for i in range(QUERIES)]
+    size = largest // 16
+    print('{:>10} {:>14} {:>14} {:>14}'.format(
+        'tokens', 'scan ms', 'all ms', 'limit {} ms'.format(LIMIT)))
+    while size <= largest:
+        index, flat = make_index(size, Random(size))
+        times = []
+        for function in [
+                lambda q: scan(flat, q, THRESHOLD),
+                lambda q: index.similar(q, THRESHOLD),
+                lambda q: index.similar(q, THRESHOLD, LIMIT)]:
+            start = perf_counter()
+            for query in queries:
+                function(query)
+            times.append((perf_counter() - start) * 1000 / QUERIES)
+        print('{:10d} {:14.3f} {:14.3f} {:14.3f}'.format(size, *times))
+        del index, flat
+        size *= 2
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure the memory saved by interning decoded documents (intern=True).
+
+A synthetic tree is walked with and without interning, and for each the
+walk time and the size of the Python heap holding the resulting
+PlaceCollection (by tracemalloc, in a separate, traced walk) are reported,
+together with the walker's own estimate of the bytes saved.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_intern [count]
+"""
+
+from benchmarks.synthetic import make_tree
+import gc
+import logging
+from pleiades.walker.walker import PleiadesWalker
+from shutil import rmtree
+import sys
+from tempfile import mkdtemp
+from time import perf_counter
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNT = 36000
+
+
+def retained(path: str, intern: bool):
+    """Return the bytes of heap held by the collection from a walk."""
+    gc.collect()
+    tracemalloc.start()
+    count, pc = PleiadesWalker(path=path, intern=intern).walk()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del pc
+    return size
+
+
+def main(count=DEFAULT_COUNT):
+    path = make_tree(mkdtemp(), count)
+    try:
+        sizes = {}
+        for intern in [False, True]:
+            w = PleiadesWalker(path=path, intern=intern)
+            start = perf_counter()
+            n, pc = w.walk()
+            elapsed = perf_counter() - start
+            del pc
+            sizes[intern] = retained(path, intern)
+            print('{:10} {:6d} files {:8.2f} s {:10.1f} MiB held'.format(
+                'interned' if intern else 'plain', n, elapsed,
+                sizes[intern] / 2 ** 20))
+        stats = w.stats.counters
+        print('{} objects shared, {:.1f} MiB saved by estimate; {:.1f} MiB '
+              '({:.0%}) less held'.format(
+                  stats['interned'], stats['interned_bytes'] / 2 ** 20,
+                  (sizes[False] - sizes[True]) / 2 ** 20,
+                  1 - sizes[True] / sizes[False]))
+    finally:
+        rmtree(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
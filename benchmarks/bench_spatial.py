@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare spatial index queries with a linear scan over PlaceCollection.places.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_spatial [count]
+"""
+
+from benchmarks.synthetic import EXTENT, make_places
+import logging
+from pleiades.walker.entities import PlaceCollection
+from random import Random
+import sys
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNT = 36000
+QUERIES = 200
+
+
+def linear_bbox(pc, minx, miny, maxx, maxy):
+    return [
+        p for p in pc.places if p.reprPoint is not None
+        and minx <= p.reprPoint[0] <= maxx and miny <= p.reprPoint[1] <= maxy]
+
+
+def linear_nearest(pc, x, y, k):
+    return sorted(
+        [p for p in pc.places if p.reprPoint is not None],
+        key=lambda p: (p.reprPoint[0] - x) ** 2 + (p.reprPoint[1] - y) ** 2
+    )[:k]
+
+
+def report(label, seconds):
+    print('{:28} {:10.3f} ms/query'.format(label, seconds * 1000 / QUERIES))
+
+
+def main(count=DEFAULT_COUNT):
+    pc = PlaceCollection(list(make_places(count)))
+    start = perf_counter()
+    pc.get('bbox', (0, 0, 0, 0))
+    print('{:28} {:10.3f} s'.format('spatial index build', perf_counter() - start))
+    rng = Random(1)
+    minx, miny, maxx, maxy = EXTENT
+    boxes = []
+    points = []
+    outside = []
+    for i in range(QUERIES):
+        x = rng.uniform(minx, maxx)
+        y = rng.uniform(miny, maxy)
+        boxes.append((x, y, x + 1.0, y + 1.0))
+        points.append((x, y, 10))
+        # as far from the extent as the other side of the world
+        outside.append(
+            (rng.uniform(-180.0, -100.0), rng.uniform(-90.0, 90.0), 10))
+    for label, function, values in [
+            ('bbox (index)', lambda v: pc.get('bbox', v), boxes),
+            ('bbox (linear scan)', lambda v: linear_bbox(pc, *v), boxes),
+            ('nearest 10 (index)', lambda v: pc.get('nearest', v), points),
+            ('nearest 10 (linear scan)', lambda v: linear_nearest(pc, *v),
+                points),
+            ('nearest 10 outside (index)', lambda v: pc.get('nearest', v),
+                outside),
+            ('nearest 10 outside (linear)',
+                lambda v: linear_nearest(pc, *v), outside)]:
+        start = perf_counter()
+        for value in values:
+            function(value)
+        report(label, perf_counter() - start)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure walking, index building and querying on synthetic trees.
+
+For each size (by default 1k, 10k and 100k places) a synthetic tree in the
+pleiades-datasets layout is generated and walked, and the following are
+reported:
+
+- load: the time taken by PleiadesWalker.walk(), and files per second
+- build: the time taken to build each index, and its number of entries
+- query: the 50th, 90th and 99th percentile latency of QUERIES random
+  queries of each kind
+- memory: the peak size of the Python heap (by tracemalloc) while walking
+  and building every index, measured in a separate, traced pass
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite [--json results.json] [size ...]
+"""
+
+import argparse
+from benchmarks.synthetic import EXTENT, make_tree
+import json
+import logging
+from pleiades.walker.query import Q
+from pleiades.walker.walker import PleiadesWalker
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+QUERIES = 200
+PERCENTILES = [50, 90, 99]
+
+# the indices built, in order
+INDICES = [
+    'id', 'name', 'in_name', 'last_modified', 'modified', 'spatial',
+    'name_search', 'placeTypes', 'review_state', 'subject', 'graph']
+
+
+def percentile(ordered: list, p: int):
+    """Return the p-th percentile of a sorted list (nearest rank)."""
+    rank = max(1, -(-p * len(ordered) // 100))
+    return ordered[rank - 1]
+
+
+def query_values(pc, rng: Random):
+    """Return (label, function, values) for each kind of query timed."""
+    places = [rng.choice(pc.places) for i in range(QUERIES)]
+    names = [pc._names(p)[0] for p in places]
+    minx, miny, maxx, maxy = EXTENT
+    points = [
+        (rng.uniform(minx, maxx), rng.uniform(miny, maxy))
+        for i in range(QUERIES)]
+    stamps = [
+        pc._latest_stamp(p)[:10] for p in places]
+    return [
+        ('id', lambda v: pc.get('id', v), [p.id for p in places]),
+        ('name', lambda v: pc.get('name', v), names),
+        ('in_name', lambda v: pc.get('in_name', v), [
+            n.split()[-1] for n in names]),
+        ('last_modified', lambda v: pc.get('last_modified'), places),
+        ('modified_since', lambda v: pc.get('modified_since', v), stamps),
+        ('bbox 1x1', lambda v: pc.get('bbox', v), [
+            (x, y, x + 1.0, y + 1.0) for x, y in points]),
+        ('nearest 10', lambda v: pc.get('nearest', v), [
+            (x, y, 10) for x, y in points]),
+        ('name_prefix', lambda v: pc.get('name_prefix', v), [
+            n[:3] for n in names]),
+        ('name_fuzzy', lambda v: pc.get('name_fuzzy', v), [
+            n[:-1] for n in names]),
+        ('placeTypes', lambda v: pc.get('placeTypes', v), [
+            p.placeTypes[0] for p in places]),
+        ('neighbors', lambda v: pc.get('neighbors', v), [
+            p.id for p in places]),
+        ('hops 3', lambda v: pc.get('hops', v), [
+            (p.id, 3) for p in places]),
+        ('path', lambda v: pc.get('path', v), [
+            (p.id, q.id) for p, q in zip(places, reversed(places))]),
+        ('query and', lambda v: pc.query(v).ids(), [
+            Q('placeTypes', p.placeTypes[0])
+            & Q('bbox', (x, y, x + 10.0, y + 10.0))
+            & Q('modified_since', '2020-01-01')
+            for p, (x, y) in zip(places, points)])
+    ]
+
+
+def time_queries(pc, rng: Random):
+    """Return the latency percentiles of each kind of query."""
+    results = {}
+    for label, function, values in query_values(pc, rng):
+        timings = []
+        for value in values:
+            start = perf_counter()
+            function(value)
+            timings.append(perf_counter() - start)
+        timings.sort()
+        results[label] = {
+            'p{}'.format(p): percentile(timings, p) for p in PERCENTILES}
+    return results
+
+
+def run(size: int, rng: Random):
+    results = {'size': size, 'build': {}}
+    path = make_tree(mkdtemp(), size)
+    try:
+        w = PleiadesWalker(path=path)
+        start = perf_counter()
+        count, pc = w.walk()
+        elapsed = perf_counter() - start
+        results['load'] = {'seconds': elapsed, 'files_per_second': (
+            count / elapsed)}
+        for it in INDICES:
+            start = perf_counter()
+            pc._ensure_index(it)
+            results['build'][it] = {
+                'seconds': perf_counter() - start,
+                'entries': len(pc.indices[it])}
+        results['query'] = time_queries(pc, rng)
+        # free the collection before the traced pass builds another
+        del pc
+        tracemalloc.start()
+        count, pc = PleiadesWalker(path=path).walk()
+        for it in INDICES:
+            pc._ensure_index(it)
+        results['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        rmtree(path)
+    return results
+
+
+def report(results: dict):
+    print('{} places'.format(results['size']))
+    load = results['load']
+    print('  {:24} {:10.3f} s {:10.0f} files/s'.format(
+        'load', load['seconds'], load['files_per_second']))
+    for it, build in results['build'].items():
+        print('  {:24} {:10.3f} s {:10d} entries'.format(
+            'build ' + it, build['seconds'], build['entries']))
+    for label, timings in results['query'].items():
+        print('  {:24} {}'.format('query ' + label, ' '.join([
+            '{} {:8.3f} ms'.format(p, t * 1000)
+            for p, t in timings.items()])))
+    print('  {:24} {:10.1f} MiB'.format(
+        'peak memory', results['peak_memory'] / 2 ** 20))
+
+
+def main(sizes=DEFAULT_SIZES, json_path=None):
+    rng = Random(1)
+    all_results = []
+    for size in sizes:
+        results = run(size, rng)
+        report(results)
+        all_results.append(results)
+    if json_path is not None:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, indent=4)
+        del f
+    return all_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        'sizes', nargs='*', type=int, default=DEFAULT_SIZES,
+        help='the numbers of places to generate')
+    parser.add_argument(
+        '--json', dest='json_path', help='also write the results here')
+    args = parser.parse_args()
+    main(args.sizes, args.json_path)
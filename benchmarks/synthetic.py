@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Generate synthetic Pleiades JSON trees from the test fixtures.
+
+Each synthetic place is a copy of one of the fixtures, so it has the same
+schema, with its own id, names, place types, timestamps, representative
+point and connections, so that index sizes grow with the number of places
+much as they do in the real gazetteer.
+"""
+
+from copy import deepcopy
+from datetime import datetime, timedelta
+import json
+import logging
+from os import makedirs, walk
+from os.path import abspath, dirname, join, splitext
+from random import Random
+
+logger = logging.getLogger(__name__)
+
+FIXTURE_PATH = join(
+    dirname(dirname(abspath(__file__))), 'tests', 'data', 'place_json')
+
+
+def load_fixtures(path=FIXTURE_PATH):
+    """Return the decoded place documents found under path."""
+    fixtures = []
+    for root, dirs, files in walk(path):
+        for filename in sorted(files):
+            if splitext(filename)[1] != '.json':
+                continue
+            with open(join(root, filename), 'r', encoding='utf-8') as f:
+                fixtures.append(json.load(f))
+            del f
+    return fixtures
+
+
+def place_path(dest: str, pid: str):
+    """Return where pleiades-datasets keeps the file for pid under dest."""
+    digits = list(pid[:max(0, min(4, len(pid) - 2))])
+    return join(dest, *digits, '{}.json'.format(pid))
+
+
+# the region over which synthetic representative points are scattered
+EXTENT = (-10.0, 25.0, 50.0, 55.0)
+
+# the period over which synthetic places are created and modified
+EPOCH = datetime(2009, 1, 1)
+PERIOD_DAYS = 16 * 365
+
+# syllables from which synthetic names are made
+SYLLABLES = [
+    'a', 'ad', 'al', 'an', 'ar', 'ca', 'ce', 'dor', 'dun', 'e', 'ga', 'i',
+    'is', 'la', 'lum', 'ma', 'na', 'nis', 'o', 'on', 'pa', 'ra', 're', 'ri',
+    'sa', 'sca', 'ta', 'te', 'ti', 'tum', 'um', 'us', 've', 'vi']
+
+# a sample of the Pleiades place type vocabulary
+PLACE_TYPES = [
+    'settlement', 'villa', 'fort', 'temple', 'sanctuary', 'mine', 'quarry',
+    'province', 'river', 'road', 'station', 'bath', 'church', 'bridge',
+    'cemetery', 'port', 'mountain', 'island', 'region', 'unknown']
+
+STAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def make_name(rng: Random):
+    """Return a random name of one or (occasionally) two words."""
+    words = []
+    for i in range(1 if rng.random() < 0.8 else 2):
+        word = ''.join([
+            rng.choice(SYLLABLES) for j in range(rng.randint(2, 4))])
+        words.append(word.capitalize())
+    return ' '.join(words)
+
+
+def _restamp(node, rng: Random, created: datetime):
+    """Replace every timestamp in node with one at or after created."""
+    if isinstance(node, list):
+        for item in node:
+            _restamp(item, rng, created)
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'created':
+                node[key] = created.strftime(STAMP_FORMAT)
+            elif key == 'modified':
+                node[key] = (created + timedelta(
+                    seconds=rng.randrange(PERIOD_DAYS * 86400))).strftime(
+                        STAMP_FORMAT)
+            else:
+                _restamp(value, rng, created)
+
+
+def make_places(count: int, fixtures=None, seed=0):
+    """Yield count place documents cloned from fixtures with fresh ids.
+
+    Each place is given random names, place types, timestamps within
+    PERIOD_DAYS of EPOCH and connections to up to three other places. Places
+    that have a representative point are moved to a random point within
+    EXTENT. The output is the same for a given seed.
+    """
+    if fixtures is None:
+        fixtures = load_fixtures()
+    rng = Random(seed)
+    minx, miny, maxx, maxy = EXTENT
+    for i in range(count):
+        place = deepcopy(fixtures[i % len(fixtures)])
+        pid = str(1000000 + i)
+        place['id'] = pid
+        place['uri'] = 'https://pleiades.stoa.org/places/{}'.format(pid)
+        names = [make_name(rng) for j in range(rng.randint(1, 3))]
+        place['title'] = names[0]
+        for name, datum in zip(names, place['names']):
+            datum['romanized'] = name
+            if datum.get('attested'):
+                datum['attested'] = name
+        place['placeTypes'] = rng.sample(PLACE_TYPES, rng.randint(1, 2))
+        place['connectsWith'] = [
+            'https://pleiades.stoa.org/places/{}'.format(
+                1000000 + (i + 1 + rng.randrange(count - 1)) % count)
+            for j in range(rng.randint(0, 3) if count > 1 else 0)]
+        _restamp(place, rng, EPOCH + timedelta(
+            seconds=rng.randrange(PERIOD_DAYS * 86400)))
+        if place.get('reprPoint') is not None:
+            x = round(rng.uniform(minx, maxx), 6)
+            y = round(rng.uniform(miny, maxy), 6)
+            place['reprPoint'] = [x, y]
+            place['bbox'] = [x, y, x, y]
+        yield place
+
+
+def make_tree(dest: str, count: int, fixtures=None, seed=0):
+    """Write count synthetic place files under dest; return dest."""
+    for place in make_places(count, fixtures, seed):
+        path = place_path(dest, place['id'])
+        makedirs(dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(place, f, ensure_ascii=False, indent=4)
+        del f
+    logger.info('Wrote {} places to {}'.format(count, dest))
+    return dest
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Read and write whole Pleiades datasets as single sequential files.
+
+The following formats are recognized by filename suffix:
+
+- '.jsonl': one JSON document per line
+- '.jsonl.gz': the same, gzip-compressed
+- '.json.gz': a gzipped pleiades-datasets JSON dump, i.e. a single object
+  whose '@graph' array holds the places (streamed with ijson if it is
+  installed, otherwise decoded in one go)
+- '.tar', '.tar.gz', '.tgz': a tar archive of a directory tree of JSON files
+
+Records are yielded as (name, offset, raw) tuples, where raw is the bytes of
+one document (or, for a dump read with ijson, the decoded document itself)
+and offset is the position of raw in the file when it can be read back with
+a seek, otherwise None. The name of a record is its path within a tar
+archive, or else its line (or, in a dump, item) number; record_pid() finds
+its pid.
+
+Run as a script to pack a directory tree into a '.jsonl' or '.jsonl.gz'
+file:
+
+    python -m pleiades.walker.bulk ../pleiades-datasets/json places.jsonl.gz
+"""
+
+import gzip
+import json
+import logging
+from os import walk
+from os.path import basename, join, splitext
+import sys
+import tarfile
+
+logger = logging.getLogger(__name__)
+
+# suffix -> format name, longest suffixes first
+FORMATS = [
+    ('.jsonl.gz', 'jsonl.gz'),
+    ('.jsonl', 'jsonl'),
+    ('.json.gz', 'dump'),
+    ('.tar.gz', 'tar.gz'),
+    ('.tgz', 'tar.gz'),
+    ('.tar', 'tar')
+]
+
+# formats whose records have offsets that CompactPlace can seek to
+SEEKABLE_FORMATS = ['jsonl', 'tar']
+
+# how every document written by pack() starts, so that its pid can be read
+# without decoding it
+_ID_PREFIX = b'{"id":"'
+
+
+def bulk_format(path: str):
+    """Return the name of the bulk format of path, or None."""
+    lower = path.lower()
+    for suffix, name in FORMATS:
+        if lower.endswith(suffix):
+            return name
+    return None
+
+
+def iter_records(path: str):
+    """Yield a (name, offset, raw) tuple for each document in a bulk file."""
+    fmt = bulk_format(path)
+    if fmt == 'jsonl':
+        yield from _iter_jsonl(path)
+    elif fmt == 'jsonl.gz':
+        with gzip.open(path, 'rb') as f:
+            yield from _iter_lines(f, seekable=False)
+        del f
+    elif fmt == 'dump':
+        yield from _iter_dump(path)
+    elif fmt in ['tar', 'tar.gz']:
+        yield from _iter_tar(path, seekable=(fmt == 'tar'))
+    else:
+        raise ValueError(
+            '{} is not a recognized bulk file. Expected a filename ending in '
+            'one of: {}.'.format(path, ', '.join([f[0] for f in FORMATS])))
+
+
+def record_pid(record: tuple, decode=json.loads):
+    """Return the pid of the place in a record from iter_records().
+
+    This is the name of its file (without '.json') for a tar member, as for
+    a file in a pleiades-datasets tree, and otherwise its 'id', read
+    without decoding the document if it was written by pack().
+    """
+    name, offset, raw = record
+    if isinstance(raw, dict):
+        return raw['id']
+    if name.lower().endswith('.json'):
+        return splitext(basename(name))[0]
+    if raw.startswith(_ID_PREFIX):
+        end = raw.find(b'"', len(_ID_PREFIX))
+        if end > 0 and b'\\' not in raw[len(_ID_PREFIX):end]:
+            return raw[len(_ID_PREFIX):end].decode('utf-8')
+    return decode(raw)['id']
+
+
+def _iter_jsonl(path: str):
+    with open(path, 'rb') as f:
+        yield from _iter_lines(f, seekable=True)
+    del f
+
+
+def _iter_lines(f, seekable: bool):
+    offset = 0
+    for n, line in enumerate(f):
+        raw = line.rstrip(b'\r\n')
+        if raw.strip() != b'':
+            yield ('{}'.format(n + 1), offset if seekable else None, raw)
+        offset += len(line)
+
+
+def _iter_dump(path: str):
+    try:
+        import ijson
+    except ImportError:
+        logger.warning(
+            'ijson is not installed: decoding all of {} at once'.format(path))
+        with gzip.open(path, 'rb') as f:
+            graph = json.load(f)['@graph']
+        del f
+        for n, place in enumerate(graph):
+            yield ('{}'.format(n + 1), None, place)
+        return
+    with gzip.open(path, 'rb') as f:
+        for n, place in enumerate(
+                ijson.items(f, '@graph.item', use_float=True)):
+            yield ('{}'.format(n + 1), None, place)
+    del f
+
+
+def _iter_tar(path: str, seekable: bool):
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            if splitext(member.name)[1].lower() != '.json':
+                continue
+            raw = archive.extractfile(member).read()
+            if seekable:
+                offset = member.offset_data
+            else:
+                offset = None
+            yield (member.name, offset, raw)
+    del archive
+
+
+def pack(path: str, dest: str):
+    """Write every JSON file under the directory path to a JSON Lines file.
+
+    The output is gzip-compressed if dest ends with '.gz'. Each document is
+    written with its 'id' first (see record_pid()). Returns the number of
+    documents written.
+    """
+    if bulk_format(dest) not in ['jsonl', 'jsonl.gz']:
+        raise ValueError(
+            '{} must end in ".jsonl" or ".jsonl.gz".'.format(dest))
+    if dest.lower().endswith('.gz'):
+        out = gzip.open(dest, 'wb')
+    else:
+        out = open(dest, 'wb')
+    count = 0
+    with out:
+        for root, dirs, files in walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                if splitext(filename)[1].lower() != '.json':
+                    continue
+                with open(join(root, filename), 'rb') as f:
+                    datum = json.loads(f.read())
+                del f
+                if 'id' in datum:
+                    datum = {'id': datum['id'], **datum}
+                out.write(json.dumps(
+                    datum, ensure_ascii=False,
+                    separators=(',', ':')).encode('utf-8'))
+                out.write(b'\n')
+                count += 1
+    logger.info('Packed {} documents from {} into {}'.format(
+        count, path, dest))
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit('usage: python -m pleiades.walker.bulk TREE DEST.jsonl[.gz]')
+    print(pack(sys.argv[1], sys.argv[2]))
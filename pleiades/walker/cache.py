@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Persist walked place data and indices between runs."""
+
+from copy import deepcopy
+import logging
+from os import replace, stat
+from os.path import exists
+import pickle
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 10
+# the first line of a cache file, checked before anything is unpickled
+CACHE_MAGIC = b'pleiades.walker cache'
+
+
+def _header():
+    return b'%s %d\n' % (CACHE_MAGIC, CACHE_VERSION)
+
+
+def file_stamp(path: str):
+    """Return the (mtime in nanoseconds, size) pair used to validate a file."""
+    st = stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class PlaceCache():
+    """A pickled store of places and indices for one source tree.
+
+    Each source file is recorded under its path relative to the root of the
+    tree, together with its stamp (see file_stamp()) and the Place loaded
+    from it. The 'layout' value describes how places were loaded (e.g. as
+    CompactPlace objects, or with only some keys); a cache written with a
+    different layout is ignored.
+    A record is only reused while the file's stamp is unchanged. Indices are
+    stored alongside and are only valid while every file is unchanged.
+
+    The file starts with a line naming its format and CACHE_VERSION, then
+    holds the pickled root and layout, then the rest of the state, so that
+    a cache of another version, tree or layout is ignored without
+    unpickling any places.
+    """
+
+    def __init__(self, path: str, root: str, layout=None):
+        self.path = path
+        self.root = root
+        self.layout = layout
+        self.files = {}
+        self.indices = None
+        self.most_recent = None
+        self.pids = None
+        self.load()
+
+    def load(self):
+        """Read the cache file, if there is a usable one."""
+        if not exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                if f.readline() != _header():
+                    logger.info('Ignoring cache file {} of another '
+                                'version'.format(self.path))
+                    return False
+                if pickle.load(f) != (self.root, self.layout):
+                    logger.info('Ignoring cache file {} of another tree or '
+                                'layout'.format(self.path))
+                    return False
+                state = pickle.load(f)
+            del f
+        except Exception as err:
+            # a cache is only ever an optimization: anything that cannot be
+            # unpickled (e.g. of classes since changed) is treated as stale
+            logger.warning('Ignoring unreadable cache file {}: {}'.format(
+                self.path, err))
+            return False
+        self.files = state['files']
+        self.indices = state['indices']
+        self.most_recent = state['most_recent']
+        self.pids = state['pids']
+        logger.info('Loaded {} cached files from {}'.format(
+            len(self.files), self.path))
+        return True
+
+    def lookup(self, relpath: str, stamp: tuple):
+        """Return the cached place for a file, or None if it has changed."""
+        try:
+            cached_stamp, place = self.files[relpath]
+        except KeyError:
+            return None
+        if cached_stamp != stamp:
+            return None
+        return place
+
+    def save(self, files: dict, pc=None):
+        """Write file records and, optionally, the indices of a collection.
+
+        - files: a dictionary mapping relative path to (stamp, place)
+        - pc: a PlaceCollection walked from exactly those files, whose
+          indices (other than 'id', which is cheap to rebuild) are stored
+          along with the pids their postings refer to
+        """
+        self.files = files
+        if pc is None:
+            self.indices = None
+            self.most_recent = None
+            self.pids = None
+        else:
+            # copies, so that later changes to pc are not restored with them
+            self.indices = deepcopy({
+                k: v for k, v in pc.indices.items() if k != 'id'})
+            self.most_recent = pc.most_recent
+            self.pids = list(pc.pids)
+        state = {
+            'files': self.files,
+            'indices': self.indices,
+            'most_recent': self.most_recent,
+            'pids': self.pids
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_header())
+            pickle.dump(
+                (self.root, self.layout), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        del f
+        replace(tmp_path, self.path)
+        logger.info('Saved {} files to cache {}'.format(
+            len(self.files), self.path))
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Export places as column-oriented tables for analysis.
+
+Places are flattened into four tables (see SCHEMA), which are written
+BATCH_SIZE places at a time so that a whole tree can be converted with
+bounded memory:
+
+- 'places': one row per place, with its representative point as x and y
+- 'names': one row per name, keyed by place_id
+- 'locations': one row per location, keyed by place_id, with x and y for
+  point geometries
+- 'place_types': one row per place type of each place
+
+Missing strings are written as '' and missing numbers as NaN. Lists of
+strings (featureType, locationType) are joined with ','.
+
+Three formats are supported:
+
+- 'parquet': a Parquet file per table (needs pyarrow)
+- 'arrow': an Arrow IPC file per table (needs pyarrow)
+- 'numpy': a directory of .npy files, one per column, that numpy.load()
+  can memory-map. Strings are stored as UTF-8 bytes ('<column>.utf8.npy')
+  with int64 end offsets ('<column>.offsets.npy'). Writing does not need
+  numpy; read_columns() reads them back, with or without it.
+
+Run as a script to convert a directory tree or bulk file:
+
+    python -m pleiades.walker.columnar ../pleiades-datasets/json out parquet
+"""
+
+from array import array
+import json
+import logging
+from math import nan
+from os import makedirs
+from os.path import join
+from pleiades.walker.entities import iter_places, PlaceCollection
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+
+FORMATS = ['parquet', 'arrow', 'numpy']
+
+# table -> [(column, type)], where type is 'str' or 'f8'
+SCHEMA = {
+    'places': [
+        ('id', 'str'), ('uri', 'str'), ('title', 'str'),
+        ('description', 'str'), ('review_state', 'str'), ('created', 'str'),
+        ('modified', 'str'), ('x', 'f8'), ('y', 'f8')],
+    'names': [
+        ('place_id', 'str'), ('id', 'str'), ('attested', 'str'),
+        ('romanized', 'str'), ('language', 'str'), ('nameType', 'str'),
+        ('transcriptionAccuracy', 'str'), ('start', 'f8'), ('end', 'f8')],
+    'locations': [
+        ('place_id', 'str'), ('id', 'str'), ('title', 'str'),
+        ('featureType', 'str'), ('locationType', 'str'), ('accuracy', 'str'),
+        ('start', 'f8'), ('end', 'f8'), ('x', 'f8'), ('y', 'f8')],
+    'place_types': [('place_id', 'str'), ('placeType', 'str')]
+}
+
+
+def _str(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ','.join([_str(v) for v in value])
+    return str(value)
+
+
+def _f8(value):
+    if value is None:
+        return nan
+    return float(value)
+
+
+def _point(geometry):
+    if geometry is None or geometry.get('type') != 'Point':
+        return (None, None)
+    return geometry['coordinates'][:2]
+
+
+def _rows(place, stamper):
+    """Return the rows of each table for one place, as (table, row)."""
+    data = place.data
+    pid = data['id']
+    x, y = data.get('reprPoint') or (None, None)
+    yield ('places', [
+        pid, data.get('uri'), data['title'], data.get('description'),
+        data.get('review_state'), data['created'],
+        stamper._latest_stamp(place), x, y])
+    for n in data['names']:
+        yield ('names', [
+            pid, n.get('id'), n.get('attested'), n.get('romanized'),
+            n.get('language'), n.get('nameType'),
+            n.get('transcriptionAccuracy'), n.get('start'), n.get('end')])
+    for l in data['locations']:
+        x, y = _point(l.get('geometry'))
+        yield ('locations', [
+            pid, l.get('id'), l.get('title'), l.get('featureType'),
+            l.get('locationType'), l.get('accuracy'), l.get('start'),
+            l.get('end'), x, y])
+    for place_type in data.get('placeTypes', []):
+        yield ('place_types', [pid, place_type])
+
+
+def _empty_batch():
+    return {
+        table: [
+            array('d') if kind == 'f8' else [] for column, kind in columns]
+        for table, columns in SCHEMA.items()}
+
+
+def iter_column_batches(places, batch_size=BATCH_SIZE):
+    """Yield {table: [column values, in SCHEMA order]} for each batch of
+    places; numeric columns are array('d'), string columns lists of str."""
+    # only used for its last-modified computation
+    stamper = PlaceCollection()
+    batch = _empty_batch()
+    count = 0
+    for place in places:
+        for table, row in _rows(place, stamper):
+            for (column, kind), values, value in zip(
+                    SCHEMA[table], batch[table], row):
+                if kind == 'f8':
+                    values.append(_f8(value))
+                else:
+                    values.append(_str(value))
+        count += 1
+        if count == batch_size:
+            yield batch
+            batch = _empty_batch()
+            count = 0
+    if count > 0:
+        yield batch
+
+
+class _ArrowWriter():
+    """Write each table to a Parquet or Arrow IPC file with pyarrow.
+
+    Every file is opened up front, as _NumpyWriter opens every column, so
+    that a table with no rows is still written, empty.
+    """
+
+    def __init__(self, path: str, format: str):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(
+                'Exporting to {} needs pyarrow, which is not installed. '
+                'Install it, or use format="numpy".'.format(format))
+        self.pa = pyarrow
+        self.path = path
+        self.format = format
+        self.writers = {}
+        self.schemas = {
+            table: pyarrow.schema([
+                (column, pyarrow.float64() if kind == 'f8'
+                    else pyarrow.string())
+                for column, kind in columns])
+            for table, columns in SCHEMA.items()}
+        for table, schema in self.schemas.items():
+            if format == 'parquet':
+                import pyarrow.parquet
+                self.writers[table] = pyarrow.parquet.ParquetWriter(
+                    join(path, '{}.parquet'.format(table)), schema)
+            else:
+                import pyarrow.ipc
+                self.writers[table] = pyarrow.ipc.new_file(
+                    join(path, '{}.arrow'.format(table)), schema)
+
+    def write(self, batch: dict):
+        for table, values in batch.items():
+            if len(values[0]) == 0:
+                continue
+            self.writers[table].write_table(self.pa.Table.from_arrays(
+                [self.pa.array(v) for v in values],
+                schema=self.schemas[table]))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# room for the header of any one-dimensional array
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(descr: str, length: int):
+    header = (
+        "{{'descr': '{}', 'fortran_order': False, 'shape': ({},), }}".format(
+            descr, length))
+    size = _NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2
+    return _NPY_MAGIC + struct.pack('<H', size) + header.ljust(
+        size - 1).encode('latin1') + b'\n'
+
+
+class _NpyColumn():
+    """A one-dimensional .npy file that is appended to, and whose header is
+    written with the final length when it is closed."""
+
+    def __init__(self, path: str, descr: str):
+        self.descr = descr
+        self.length = 0
+        self.f = open(path, 'wb')
+        self.f.write(_npy_header(descr, 0))
+
+    def write(self, raw: bytes, length: int):
+        self.f.write(raw)
+        self.length += length
+
+    def close(self):
+        self.f.seek(0)
+        self.f.write(_npy_header(self.descr, self.length))
+        self.f.close()
+
+
+class _NumpyWriter():
+    """Write each column of each table to .npy files."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.columns = {}
+        self.ends = {}
+        for table, columns in SCHEMA.items():
+            for column, kind in columns:
+                name = join(path, '{}.{}'.format(table, column))
+                if kind == 'f8':
+                    self.columns[(table, column)] = [
+                        _NpyColumn(name + '.npy', '<f8')]
+                else:
+                    self.columns[(table, column)] = [
+                        _NpyColumn(name + '.offsets.npy', '<i8'),
+                        _NpyColumn(name + '.utf8.npy', '|u1')]
+                    self.ends[(table, column)] = 0
+
+    def write(self, batch: dict):
+        for table, values in batch.items():
+            for (column, kind), column_values in zip(SCHEMA[table], values):
+                files = self.columns[(table, column)]
+                if kind == 'f8':
+                    if sys.byteorder != 'little':
+                        column_values.byteswap()
+                    files[0].write(
+                        column_values.tobytes(), len(column_values))
+                    continue
+                end = self.ends[(table, column)]
+                offsets = array('q')
+                chunks = []
+                for value in column_values:
+                    raw = value.encode('utf-8')
+                    end += len(raw)
+                    offsets.append(end)
+                    chunks.append(raw)
+                self.ends[(table, column)] = end
+                if sys.byteorder != 'little':
+                    offsets.byteswap()
+                files[0].write(offsets.tobytes(), len(offsets))
+                blob = b''.join(chunks)
+                files[1].write(blob, len(blob))
+
+    def close(self):
+        rows = {}
+        for (table, column), files in self.columns.items():
+            rows[table] = files[0].length
+            for f in files:
+                f.close()
+        with open(join(self.path, 'schema.json'), 'w') as f:
+            json.dump({'tables': SCHEMA, 'rows': rows}, f, indent=4)
+        del f
+
+
+def export_columns(
+        source, path: str, format='parquet', batch_size=BATCH_SIZE):
+    """Write the places of source to column files in the directory path.
+
+    - source: a PlaceCollection, a walker (whose iter_places() is used, so
+      that places are converted as they are loaded), or any iterable of
+      places
+    - format: one of FORMATS
+
+    Returns the number of places written.
+    """
+    if format not in FORMATS:
+        raise ValueError(
+            'Unknown column format "{}". Expected one of: {}.'.format(
+                format, ', '.join(FORMATS)))
+    makedirs(path, exist_ok=True)
+    if format == 'numpy':
+        writer = _NumpyWriter(path)
+    else:
+        writer = _ArrowWriter(path, format)
+    count = 0
+    try:
+        for batch in iter_column_batches(iter_places(source), batch_size):
+            writer.write(batch)
+            count += len(batch['places'][0])
+    finally:
+        writer.close()
+    logger.info('Exported {} places as {} columns to {}'.format(
+        count, format, path))
+    return count
+
+
+def _read_npy(path: str):
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        return numpy.load(path, mmap_mode='r')
+    with open(path, 'rb') as f:
+        raw = f.read()
+    del f
+    header = raw[:_NPY_HEADER_SIZE].decode('latin1')
+    typecode = {"'<f8'": 'd', "'<i8'": 'q', "'|u1'": 'B'}[
+        header.split("'descr': ")[1].split(',')[0]]
+    values = array(typecode)
+    values.frombytes(raw[_NPY_HEADER_SIZE:])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def read_columns(path: str, table: str):
+    """Read a table written with format='numpy' back as {column: values}.
+
+    Numeric columns are memory-mapped numpy arrays if numpy is installed,
+    otherwise array('d'); string columns are lists of str.
+    """
+    columns = {}
+    for column, kind in SCHEMA[table]:
+        name = join(path, '{}.{}'.format(table, column))
+        if kind == 'f8':
+            columns[column] = _read_npy(name + '.npy')
+            continue
+        offsets = _read_npy(name + '.offsets.npy')
+        blob = bytes(_read_npy(name + '.utf8.npy'))
+        values = []
+        start = 0
+        for end in offsets:
+            end = int(end)
+            values.append(blob[start:end].decode('utf-8'))
+            start = end
+        columns[column] = values
+    return columns
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [3, 4]:
+        sys.exit(
+            'usage: python -m pleiades.walker.columnar TREE DEST '
+            '[{}]'.format('|'.join(FORMATS)))
+    from pleiades.walker.walker import PleiadesWalker
+    print(export_columns(
+        PleiadesWalker(sys.argv[1]), sys.argv[2],
+        *sys.argv[3:]))
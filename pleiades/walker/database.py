@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Places and their indices in a SQLite database, queried out of core.
+
+A PlaceDatabase holds, in one SQLite file:
+
+- 'places': the JSON document of each place, by pid, with its ordinal (its
+  rowid, which orders results as a PlaceCollection would) and the date of
+  its latest modification (as in the 'last_modified' index)
+- 'words': an FTS5 table of the 'name' and 'in_name' tokens of each place
+  (see PlaceCollection._name_tokens() and _in_name_tokens()), one
+  space-separated column for each
+
+Only SQLite's page cache and the places being returned are held in
+memory, however many places there are, and the file can be opened again by
+later runs (or several processes) without loading anything.
+"""
+
+import json
+import logging
+from os.path import exists
+from pleiades.walker.decoders import get_decoder
+from pleiades.walker.entities import iter_places, Place, PlaceCollection
+import sqlite3
+import sys
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# bumped whenever the schema changes
+SCHEMA_VERSION = 1
+INDICES = ['id', 'name', 'in_name', 'last_modified']
+# the number of places written in each transaction by load()
+LOAD_BATCH_SIZE = 2000
+
+_SCHEMA = [
+    'CREATE TABLE places ('
+    ' ordinal INTEGER PRIMARY KEY, pid TEXT NOT NULL UNIQUE,'
+    ' latest TEXT NOT NULL, doc BLOB NOT NULL)',
+    'CREATE INDEX places_latest ON places (latest)',
+    "CREATE VIRTUAL TABLE words USING fts5("
+    " name, in_name, tokenize='ascii')",
+    'PRAGMA user_version = {}'.format(SCHEMA_VERSION)
+]
+
+
+class PlaceDatabase():
+    """A SQLite file of places with the same get() interface as
+    PlaceCollection, for the indices in INDICES.
+
+    The database at 'path' is created if it does not exist. Returned places
+    are decoded with 'decoder' (see pleiades.walker.decoders.get_decoder()).
+    """
+
+    def __init__(self, path: str, decoder=None):
+        self.path = path
+        self._decode = get_decoder(decoder)
+        created = not exists(path)
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if created or version == 0:
+            with self._db:
+                for statement in _SCHEMA:
+                    self._db.execute(statement)
+        elif version != SCHEMA_VERSION:
+            self._db.close()
+            raise ValueError(
+                '{} is a place database of version {}, not {}.'.format(
+                    path, version, SCHEMA_VERSION))
+        # used for its tokenization and last-modified computation
+        self._tokens = PlaceCollection()
+
+    def __len__(self):
+        return self._db.execute('SELECT count(*) FROM places').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def load(self, source, batch_size=LOAD_BATCH_SIZE):
+        """Add the places of source, replacing any with the same pid.
+
+        - source: a PlaceCollection, a walker (whose iter_places() is used,
+          so that places are written as they are loaded) or any iterable of
+          places
+
+        Places are written batch_size at a time, each batch in a single
+        transaction. Returns the number of places written.
+        """
+        start = perf_counter()
+        count = 0
+        batch = []
+        for place in iter_places(source):
+            # keep only the rows, not the places, until they are written
+            batch.append(self._rows(place))
+            if len(batch) == batch_size:
+                self._write(batch)
+                count += len(batch)
+                batch = []
+        if len(batch) > 0:
+            self._write(batch)
+            count += len(batch)
+        with self._db:
+            self._db.execute('PRAGMA optimize')
+        logger.info('Loaded {} places into {} in {:.3f} s'.format(
+            count, self.path, perf_counter() - start))
+        return count
+
+    def _rows(self, place):
+        """Return the 'places' and 'words' rows for place."""
+        tokens = self._tokens
+        names = tokens._names(place)
+        return (
+            (place.id, tokens._latest(place), json.dumps(
+                place.data, ensure_ascii=False,
+                separators=(',', ':')).encode('utf-8')),
+            (' '.join(tokens._name_tokens(names)),
+                ' '.join(tokens._in_name_tokens(names))))
+
+    def _write(self, batch: list):
+        # a later place replaces an earlier one with the same pid, in the
+        # same batch as in the database
+        rows = {}
+        for row, words in batch:
+            rows.pop(row[0], None)
+            rows[row[0]] = (row, words)
+        db = self._db
+        with db:
+            self._delete(db, list(rows.keys()))
+            for row, words in rows.values():
+                ordinal = db.execute(
+                    'INSERT INTO places (pid, latest, doc) VALUES (?, ?, ?)',
+                    row).lastrowid
+                db.execute(
+                    'INSERT INTO words (rowid, name, in_name) '
+                    'VALUES (?, ?, ?)', (ordinal,) + words)
+
+    def _delete(self, db, pids: list):
+        ordinals = []
+        for pid in pids:
+            row = db.execute(
+                'SELECT ordinal FROM places WHERE pid = ?', (pid,)).fetchone()
+            if row is not None:
+                ordinals.append(row)
+        if len(ordinals) == 0:
+            return
+        db.executemany('DELETE FROM places WHERE ordinal = ?', ordinals)
+        db.executemany('DELETE FROM words WHERE rowid = ?', ordinals)
+
+    def remove_places(self, pids):
+        """Remove the places with the given pids."""
+        with self._db:
+            self._delete(self._db, list(pids))
+
+    @property
+    def most_recent(self):
+        latest = self._db.execute(
+            'SELECT max(latest) FROM places').fetchone()[0]
+        if latest is None:
+            return '19700101'
+        return latest
+
+    def get(self, it, value=None):
+        if it == 'id':
+            cursor = self._db.execute(
+                'SELECT doc FROM places WHERE pid = ?', (value,))
+        elif it == 'last_modified':
+            cursor = self._db.execute(
+                'SELECT doc FROM places WHERE latest = ? ORDER BY ordinal',
+                (self.most_recent,))
+        elif it in ['name', 'in_name']:
+            token = self._tokens._tokenize(value)
+            if token == '':
+                return []
+            # the FTS5 tokenizer may split a token further, so the phrase
+            # query can match more than the token: check the matches
+            cursor = self._db.execute(
+                'SELECT doc FROM places WHERE ordinal IN ('
+                ' SELECT rowid FROM words WHERE words MATCH ?'
+                " AND instr(' ' || {0} || ' ', ?) > 0)"
+                ' ORDER BY ordinal'.format(it),
+                ('{} : "{}"'.format(it, token.replace('"', '""')),
+                    ' {} '.format(token)))
+        else:
+            raise ValueError(
+                'Unexpected index "{}". Expected one of: {}.'.format(
+                    it, ', '.join(INDICES)))
+        return [Place(self._decode(row[0])) for row in cursor]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit('usage: python -m pleiades.walker.database TREE DATABASE')
+    from pleiades.walker.walker import PleiadesWalker
+    with PlaceDatabase(sys.argv[2]) as database:
+        print(database.load(PleiadesWalker(sys.argv[1])))
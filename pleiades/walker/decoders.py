@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Choose a function for decoding JSON documents from bytes."""
+
+from importlib import import_module
+from itertools import chain
+import logging
+from sys import getsizeof
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# the most distinct values an Interner holds before it starts afresh
+INTERN_TABLE_SIZE = 2 ** 20
+
+# candidate backends, fastest first: name -> (module, function)
+BACKENDS = {
+    'orjson': ('orjson', 'loads'),
+    'simdjson': ('simdjson', 'loads'),
+    'ujson': ('ujson', 'loads'),
+    'json': ('json', 'loads')
+}
+
+
+def available_decoders():
+    """Return the names of the installed backends, fastest first."""
+    names = []
+    for name, (module, function) in BACKENDS.items():
+        try:
+            import_module(module)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_decoder(decoder=None):
+    """Return a callable that decodes a JSON document from bytes.
+
+    - decoder: the name of a backend in BACKENDS, a callable (returned as
+      is), or None to use the fastest installed backend
+    """
+    if callable(decoder):
+        return decoder
+    if decoder is None:
+        decoder = available_decoders()[0]
+    try:
+        module, function = BACKENDS[decoder]
+    except KeyError:
+        raise ValueError(
+            'Unknown JSON decoder "{}". Expected one of: {}.'.format(
+                decoder, ', '.join(BACKENDS.keys())))
+    logger.debug('Using the {} JSON decoder'.format(decoder))
+    return getattr(import_module(module), function)
+
+
+def project(data: dict, keys):
+    """Return a copy of a decoded document with only the given keys."""
+    return {k: data[k] for k in keys if k in data}
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(
+        'Interned records are shared between documents and cannot be '
+        'modified; copy them first.')
+
+
+class FrozenDict(dict):
+    """A dictionary that cannot be modified, as Interner shares them.
+
+    It is otherwise a dict, so it compares equal to, is encoded to JSON and
+    is pickled (as itself) like one.
+    """
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+class FrozenList(list):
+    """A list that cannot be modified, as Interner shares them.
+
+    It is otherwise a list, so it compares equal to, is encoded to JSON and
+    is pickled (as itself) like one.
+    """
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = _read_only
+    sort = reverse = _read_only
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+
+class Interner():
+    """Make equal strings and equal leaf records in decoded documents share
+    one object.
+
+    Every string, key or value, is replaced by the first equal string seen,
+    and so is every non-empty dictionary or list whose values are all
+    strings (or None), once its own strings have been. Contributor records,
+    the 'rights' text, vocabulary URIs, review states and timestamps that
+    recur across thousands of places are then held once. Shared records are
+    made read-only (as a FrozenDict or FrozenList), so that changing one
+    document cannot change another.
+
+    The table of values seen is cleared whenever it reaches 'size' entries,
+    which bounds its memory when documents are streamed rather than kept.
+    'shared' counts the objects replaced and 'saved' estimates the bytes
+    they occupied (by sys.getsizeof()). An Interner is thread-safe, and is
+    pickled without its table.
+    """
+
+    def __init__(self, size=INTERN_TABLE_SIZE):
+        self.size = size
+        self.table = {}
+        self.shared = 0
+        self.saved = 0
+        self._lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['table'] = {}
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def __call__(self, datum):
+        return self.intern([datum])[0][0]
+
+    def intern(self, data: list):
+        """Intern a list of documents.
+
+        Returns (documents, shared, saved), where shared and saved are the
+        numbers of objects and bytes saved by this call alone.
+        """
+        with self._lock:
+            if len(self.table) >= self.size:
+                self.table.clear()
+            shared = self.shared
+            saved = self.saved
+            data = [self._value(datum) for datum in data]
+            return (data, self.shared - shared, self.saved - saved)
+
+    def _share(self, key, value):
+        kept = self.table.setdefault(key, value)
+        if kept is not value:
+            self.shared += 1
+            self.saved += getsizeof(value)
+        return kept
+
+    def _freeze(self, key, value, kind):
+        """Return the record shared under key, or share a read-only copy of
+        value."""
+        try:
+            kept = self.table[key]
+        except KeyError:
+            kept = self.table[key] = kind(value)
+            return kept
+        self.shared += 1
+        self.saved += getsizeof(value)
+        return kept
+
+    def _value(self, value):
+        kind = type(value)
+        if kind is str:
+            return self._share(value, value)
+        if kind is dict:
+            return self._dict(value)
+        if kind is list:
+            return self._list(value)
+        return value
+
+    # _dict() and _list() are the inner loop of interning, so they look up
+    # strings inline rather than through _share()
+
+    def _dict(self, data: dict):
+        setdefault = self.table.setdefault
+        shared = 0
+        saved = 0
+        leaf = True
+        rekey = False
+        for key, value in data.items():
+            kind = type(value)
+            if kind is str:
+                kept = setdefault(value, value)
+                if kept is not value:
+                    shared += 1
+                    saved += getsizeof(value)
+                    # replacing the value of an existing key is safe while
+                    # iterating
+                    data[key] = kept
+            elif kind is dict:
+                data[key] = self._dict(value)
+                leaf = False
+            elif kind is list:
+                data[key] = self._list(value)
+                leaf = False
+            elif value is not None:
+                leaf = False
+            if setdefault(key, key) is not key:
+                rekey = True
+        if rekey:
+            # some decoders give each document its own copies of the keys
+            interned = {}
+            for key, value in data.items():
+                kept = setdefault(key, key)
+                if kept is not key:
+                    shared += 1
+                    saved += getsizeof(key)
+                interned[kept] = value
+            data = interned
+        self.shared += shared
+        self.saved += saved
+        if leaf and len(data) > 0:
+            # keys and values alternate, after a marker of the type
+            return self._freeze(
+                (dict, *chain.from_iterable(data.items())), data, FrozenDict)
+        return data
+
+    def _list(self, values: list):
+        setdefault = self.table.setdefault
+        shared = 0
+        saved = 0
+        leaf = True
+        for i, value in enumerate(values):
+            kind = type(value)
+            if kind is str:
+                kept = setdefault(value, value)
+                if kept is not value:
+                    shared += 1
+                    saved += getsizeof(value)
+                    values[i] = kept
+            elif kind is dict:
+                values[i] = self._dict(value)
+                leaf = False
+            elif kind is list:
+                values[i] = self._list(value)
+                leaf = False
+            elif value is not None:
+                leaf = False
+        self.shared += shared
+        self.saved += saved
+        if leaf and len(values) > 0:
+            return self._freeze((list, *values), values, FrozenList)
+        return values
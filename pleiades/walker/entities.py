@@ -4,25 +4,734 @@
 Python 3 script template (changeme)
 """
 
-import better_exceptions
-from copy import deepcopy
-import dateutil.parser
-from itertools import permutations
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+import heapq
+import json
 import logging
-from pprint import pformat
+from math import ceil, isnan, nan
+from os import cpu_count
+from pleiades.walker.stats import Stats
+import re
+from time import perf_counter
 import unicodedata
 import unidecode
-import sys
 
 logger = logging.getLogger(__name__)
-punct_table = dict.fromkeys(
-    i for i in range(sys.maxunicode)
-    if unicodedata.category(chr(i)).startswith('P'))
 
 
-class Place():
+class _PunctuationTable(dict):
+    """A str.translate() table that deletes punctuation characters.
 
-    def __init__(self, attributes: dict):
+    Entries are filled in the first time each code point is looked up, so
+    nothing is computed at import time and only characters that actually
+    occur in names are ever classified.
+    """
+
+    def __missing__(self, key: int):
+        if unicodedata.category(chr(key)).startswith('P'):
+            value = None
+        else:
+            value = key
+        self[key] = value
+        return value
+
+
+punct_table = _PunctuationTable()
+
+TOKEN_CACHE_SIZE = 2 ** 16
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def tokenize(raw: str):
+    """Normalize a name for indexing and lookup.
+
+    Punctuation and whitespace are removed, the result is transliterated to
+    ASCII and lowercased. Results are kept in a bounded LRU cache since the
+    same names recur across many places.
+    """
+    cooked = raw.strip()
+    cooked = cooked.translate(punct_table)
+    cooked = unidecode.unidecode(cooked)
+    cooked = ''.join(cooked.split()).lower()
+    return cooked
+
+
+def tokenize_many(raws):
+    """Return the set of tokens for an iterable of names.
+
+    Each distinct name is normalized only once.
+    """
+    return {tokenize(raw) for raw in set(raws)}
+
+
+def _post(entry: array, n: int):
+    """Add ordinal n to a sorted posting array unless already present."""
+    if len(entry) == 0 or entry[-1] < n:
+        entry.append(n)
+    elif entry[-1] != n:
+        i = bisect_left(entry, n)
+        if entry[i] != n:
+            entry.insert(i, n)
+
+
+def _unpost(entry: array, n: int):
+    """Remove ordinal n from a sorted posting array if present."""
+    i = bisect_left(entry, n)
+    if i < len(entry) and entry[i] == n:
+        del entry[i]
+
+
+def _join(entry: array, other: array):
+    """Add the ordinals in the sorted array other to the sorted entry."""
+    if len(other) == 0:
+        return
+    if len(entry) == 0 or entry[-1] < other[0]:
+        entry.extend(other)
+    else:
+        entry[:] = array('I', sorted(set(entry).union(other)))
+
+
+def _remap(entry: array, mapping):
+    """Return the sorted posting array of entry's ordinals under mapping."""
+    if mapping is None:
+        return entry
+    return array('I', sorted([mapping[n] for n in entry]))
+
+
+def _join_postings(index: dict, other: dict, mapping=None):
+    """Add the postings of the index other to index.
+
+    If given, mapping[n] is the ordinal in index of ordinal n in other.
+    """
+    for key, entry in other.items():
+        entry = _remap(entry, mapping)
+        try:
+            _join(index[key], entry)
+        except KeyError:
+            index[key] = entry
+
+
+STAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+_stamp_pattern = re.compile(r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ\Z')
+_date_pattern = re.compile(r'\d{4}-\d\d-\d\d\Z')
+
+
+def normalize_stamp(value):
+    """Return a timestamp as a UTC string in Pleiades' STAMP_FORMAT.
+
+    Strings already in that format (as all Pleiades timestamps are) are
+    returned unchanged; bare 'YYYY-MM-DD' dates mean midnight UTC. Other
+    strings are parsed with dateutil. Naive datetimes are taken to be UTC.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.strftime(STAMP_FORMAT)
+    if _stamp_pattern.match(value):
+        return value
+    if _date_pattern.match(value):
+        return value + 'T00:00:00Z'
+    import dateutil.parser
+    return normalize_stamp(dateutil.parser.parse(value))
+
+
+class StampIndex():
+    """Place ordinals kept in timestamp order for range queries.
+
+    Additions are buffered and merged in with a single sort the next time
+    the index is queried, so a full build costs one O(n log n) sort.
+    """
+
+    def __init__(self):
+        self.stamps = []
+        self.ordinals = array('I')
+        self._pending = []
+
+    def __len__(self):
+        return len(self.stamps) + len(self._pending)
+
+    def add(self, stamp: str, n: int):
+        self._pending.append((stamp, n))
+
+    def remove(self, stamp: str, n: int):
+        self._sort()
+        i = bisect_left(self.stamps, stamp)
+        while i < len(self.stamps) and self.stamps[i] == stamp:
+            if self.ordinals[i] == n:
+                del self.stamps[i]
+                del self.ordinals[i]
+                return
+            i += 1
+
+    def merge(self, other, mapping=None):
+        """Add the entries of another StampIndex, mapping its ordinals as
+        _join_postings() does."""
+        pairs = list(zip(other.stamps, other.ordinals)) + other._pending
+        if mapping is not None:
+            pairs = [(stamp, mapping[n]) for stamp, n in pairs]
+        self._pending.extend(pairs)
+
+    def between(self, start=None, end=None):
+        """Return ordinals with start <= stamp < end, oldest first."""
+        self._sort()
+        if start is None:
+            lo = 0
+        else:
+            lo = bisect_left(self.stamps, start)
+        if end is None:
+            hi = len(self.stamps)
+        else:
+            hi = bisect_left(self.stamps, end)
+        return self.ordinals[lo:hi]
+
+    def _sort(self):
+        if len(self._pending) == 0:
+            return
+        pairs = sorted(set(
+            list(zip(self.stamps, self.ordinals)) + self._pending))
+        self.stamps = [stamp for stamp, n in pairs]
+        self.ordinals = array('I', [n for stamp, n in pairs])
+        self._pending = []
+
+
+class SpatialIndex():
+    """Place ordinals bucketed by the grid cell of their representative point.
+
+    Coordinates are longitude (x) and latitude (y) in degrees, held in flat
+    arrays indexed by ordinal; cells are 'cell_size' degrees square. Bounding
+    box queries only visit the cells that overlap the box, and nearest
+    neighbour queries search outwards from the query point ring by ring.
+    Distances are planar, in degrees.
+    """
+
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.xs = array('d')
+        self.ys = array('d')
+        self._count = 0
+        # the range of cells ever occupied: (minx, miny, maxx, maxy)
+        self._extent = (0, 0, 0, 0)
+
+    def __len__(self):
+        return self._count
+
+    def _cell(self, x: float, y: float):
+        return (
+            int(x // self.cell_size), int(y // self.cell_size))
+
+    def add(self, n: int, x: float, y: float):
+        while len(self.xs) <= n:
+            self.xs.append(nan)
+            self.ys.append(nan)
+        if not isnan(self.xs[n]):
+            self.remove(n)
+        self.xs[n] = x
+        self.ys[n] = y
+        cell = self._cell(x, y)
+        try:
+            entry = self.cells[cell]
+        except KeyError:
+            entry = self.cells[cell] = array('I')
+            if len(self.cells) == 1:
+                self._extent = cell + cell
+            else:
+                minx, miny, maxx, maxy = self._extent
+                self._extent = (
+                    min(minx, cell[0]), min(miny, cell[1]),
+                    max(maxx, cell[0]), max(maxy, cell[1]))
+        _post(entry, n)
+        self._count += 1
+
+    def remove(self, n: int):
+        if n >= len(self.xs) or isnan(self.xs[n]):
+            return
+        cell = self._cell(self.xs[n], self.ys[n])
+        entry = self.cells[cell]
+        _unpost(entry, n)
+        if len(entry) == 0:
+            del self.cells[cell]
+        self.xs[n] = nan
+        self.ys[n] = nan
+        self._count -= 1
+
+    def merge(self, other, mapping=None):
+        """Add the points of another SpatialIndex with the same cell size,
+        none of whose ordinals are in this one, mapping its ordinals as
+        _join_postings() does."""
+        if other.cell_size != self.cell_size:
+            raise ValueError(
+                'Cannot merge spatial indices with cell sizes {} and '
+                '{}.'.format(self.cell_size, other.cell_size))
+        if len(other.cells) == 0:
+            return
+        if mapping is not None:
+            for n, x in enumerate(other.xs):
+                if not isnan(x):
+                    self.add(mapping[n], x, other.ys[n])
+            return
+        while len(self.xs) < len(other.xs):
+            self.xs.append(nan)
+            self.ys.append(nan)
+        for n, x in enumerate(other.xs):
+            if not isnan(x):
+                self.xs[n] = x
+                self.ys[n] = other.ys[n]
+        _join_postings(self.cells, other.cells)
+        if self._count == 0:
+            self._extent = other._extent
+        else:
+            self._extent = (
+                min(self._extent[0], other._extent[0]),
+                min(self._extent[1], other._extent[1]),
+                max(self._extent[2], other._extent[2]),
+                max(self._extent[3], other._extent[3]))
+        self._count += other._count
+
+    def within(self, minx, miny, maxx, maxy):
+        """Return the ordinals of points inside a bounding box."""
+        xs = self.xs
+        ys = self.ys
+        cminx, cminy = self._cell(minx, miny)
+        cmaxx, cmaxy = self._cell(maxx, maxy)
+        hits = []
+        if (cmaxx - cminx + 1) * (cmaxy - cminy + 1) > len(self.cells):
+            cells = [
+                entry for (cx, cy), entry in self.cells.items()
+                if cminx <= cx <= cmaxx and cminy <= cy <= cmaxy]
+        else:
+            cells = [
+                self.cells[(cx, cy)]
+                for cx in range(cminx, cmaxx + 1)
+                for cy in range(cminy, cmaxy + 1)
+                if (cx, cy) in self.cells]
+        for entry in cells:
+            hits.extend([
+                n for n in entry
+                if minx <= xs[n] <= maxx and miny <= ys[n] <= maxy])
+        return sorted(hits)
+
+    def nearest(self, x: float, y: float, k=1):
+        """Return the ordinals of the k points nearest (x, y), nearest first.
+
+        Rings of cells are searched around the cell of the extent nearest
+        (x, y), visiting only cells inside the extent, until no unsearched
+        cell can be nearer than the k-th point found.
+        """
+        if self._count == 0 or k < 1:
+            return []
+        xs = self.xs
+        ys = self.ys
+        cells = self.cells
+        size = self.cell_size
+        minx, miny, maxx, maxy = self._extent
+        cx, cy = self._cell(x, y)
+        cx = min(max(cx, minx), maxx)
+        cy = min(max(cy, miny), maxy)
+        last_ring = max(cx - minx, maxx - cx, cy - miny, maxy - cy)
+        found = []
+        ring = 0
+        while ring <= last_ring:
+            left = max(cx - ring, minx)
+            right = min(cx + ring, maxx)
+            bottom = max(cy - ring, miny)
+            top = min(cy + ring, maxy)
+            ring_cells = []
+            for ccy in {cy - ring, cy + ring}:
+                if miny <= ccy <= maxy:
+                    ring_cells.extend(
+                        [(ccx, ccy) for ccx in range(left, right + 1)])
+            for ccx in {cx - ring, cx + ring}:
+                if minx <= ccx <= maxx:
+                    ring_cells.extend([
+                        (ccx, ccy) for ccy in range(bottom, top + 1)
+                        if abs(ccy - cy) != ring])
+            for cell in ring_cells:
+                try:
+                    entry = cells[cell]
+                except KeyError:
+                    continue
+                found.extend([
+                    ((xs[n] - x) ** 2 + (ys[n] - y) ** 2, n)
+                    for n in entry])
+            found.sort()
+            del found[k:]
+            # the cells not yet searched are the parts of the extent beyond
+            # each side of the rings searched so far
+            beyond = []
+            if left > minx:
+                beyond.append((minx, miny, left, maxy + 1))
+            if right < maxx:
+                beyond.append((right + 1, miny, maxx + 1, maxy + 1))
+            if bottom > miny:
+                beyond.append((minx, miny, maxx + 1, bottom))
+            if top < maxy:
+                beyond.append((minx, top + 1, maxx + 1, maxy + 1))
+            if len(beyond) == 0:
+                break
+            if len(found) == k and found[-1][0] <= min([
+                    _distance2(x, y, x0 * size, y0 * size, x1 * size,
+                               y1 * size)
+                    for x0, y0, x1, y1 in beyond]):
+                break
+            ring += 1
+        return [n for d, n in found]
+
+
+def _distance2(x: float, y: float, minx, miny, maxx, maxy):
+    """Return the squared distance from (x, y) to a rectangle."""
+    dx = max(minx - x, 0, x - maxx)
+    dy = max(miny - y, 0, y - maxy)
+    return dx * dx + dy * dy
+
+
+def _trigrams(token: str):
+    padded = '  {} '.format(token)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameSearchIndex():
+    """Name tokens for prefix and fuzzy (trigram) search.
+
+    Each token of a place's names and of the words in them (the same tokens
+    as in the 'name' and 'in_name' indices) is posted to the ordinals of the
+    places that use it. A sorted token list, rebuilt only after the
+    vocabulary changes, answers prefix queries by bisection; a trigram index
+    over the vocabulary, keyed by the number of distinct trigrams of each
+    token and by trigram, finds candidate
+    tokens for fuzzy queries, which are ranked by the Dice coefficient of
+    their trigram sets.
+    """
+
+    def __init__(self):
+        self.terms = {}
+        self.trigrams = {}
+        self._sorted = []
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _post_grams(self, token: str):
+        grams = _trigrams(token)
+        b = len(grams)
+        for gram in grams:
+            try:
+                self.trigrams[(b, gram)].append(token)
+            except KeyError:
+                self.trigrams[(b, gram)] = [token]
+        self._dirty = True
+
+    def add(self, tokens, n: int):
+        for token in tokens:
+            try:
+                entry = self.terms[token]
+            except KeyError:
+                entry = self.terms[token] = array('I')
+                self._post_grams(token)
+            _post(entry, n)
+
+    def remove(self, tokens, n: int):
+        for token in tokens:
+            try:
+                entry = self.terms[token]
+            except KeyError:
+                continue
+            _unpost(entry, n)
+            if len(entry) > 0:
+                continue
+            del self.terms[token]
+            grams = _trigrams(token)
+            b = len(grams)
+            for gram in grams:
+                terms = self.trigrams[(b, gram)]
+                terms.remove(token)
+                if len(terms) == 0:
+                    del self.trigrams[(b, gram)]
+            self._dirty = True
+
+    def merge(self, other, mapping=None):
+        """Add the tokens and postings of another NameSearchIndex, mapping
+        its ordinals as _join_postings() does."""
+        for token, entry in other.terms.items():
+            entry = _remap(entry, mapping)
+            try:
+                _join(self.terms[token], entry)
+            except KeyError:
+                self.terms[token] = entry
+                self._post_grams(token)
+
+    def prefixed(self, prefix: str, limit=None):
+        """Return the tokens that start with prefix, in sorted order."""
+        if self._dirty:
+            self._sorted = sorted(self.terms.keys())
+            self._dirty = False
+        terms = self._sorted
+        i = bisect_left(terms, prefix)
+        hits = []
+        while i < len(terms) and terms[i].startswith(prefix):
+            hits.append(terms[i])
+            if limit is not None and len(hits) == limit:
+                break
+            i += 1
+        return hits
+
+    def similar(self, token: str, threshold=0.3, limit=None):
+        """Return (score, token) pairs for tokens like token, best first
+        (at most limit of them)."""
+        if limit == 0:
+            return []
+        scored = self._similar(_trigrams(token), threshold, limit)
+        scored.sort()
+        if limit is not None:
+            del scored[limit:]
+        return [(-score, term) for score, term in scored]
+
+    def _similar(self, grams: set, threshold: float, limit=None):
+        """Return (-score, token) pairs for the tokens whose Dice
+        coefficient with grams is at least threshold (or at least those of
+        the best limit of them).
+
+        A token of b distinct trigrams scores at most 2 * min(a, b) / (a + b)
+        against a query of a, and only reaches threshold if it shares
+        overlap = ceil(threshold * (a + b) / 2) of them. Such a token must
+        have one of any a - overlap + 1 of the query's trigrams, so for
+        each b candidates are only taken from the postings of the rarest of
+        them, and checked for the others, those sharing the most first.
+        Once limit tokens are found, the threshold is raised to the worst of
+        their scores, so the values of b are searched best first too.
+        """
+        a = len(grams)
+        if threshold > 0:
+            longest = int((2 - threshold) * a / threshold + 1e-9)
+        else:
+            # a token has at most len(token) + 1 trigrams
+            longest = max(map(len, self.terms), default=0) + 1
+        sizes = sorted(
+            range(1, longest + 1), key=lambda b: -min(a, b) / (a + b))
+        scored = []
+        # the best limit scores, as a heap
+        best = []
+        for b in sizes:
+            if 2.0 * min(a, b) / (a + b) < threshold:
+                break
+            overlap = max(1, ceil(threshold * (a + b) / 2 - 1e-9))
+            postings = sorted(
+                [(self.trigrams.get((b, gram), ()), gram)
+                    for gram in grams], key=lambda p: len(p[0]))
+            shared = Counter()
+            for terms, gram in postings[:a - overlap + 1]:
+                shared.update(terms)
+            rest = [gram for terms, gram in postings[a - overlap + 1:]]
+            for term, count in shared.most_common():
+                if 2.0 * (count + len(rest)) < threshold * (a + b):
+                    break
+                # every trigram of the padded token is a substring of it
+                padded = '  {} '.format(term)
+                for gram in rest:
+                    if gram in padded:
+                        count += 1
+                score = 2.0 * count / (a + b)
+                if score < threshold:
+                    continue
+                scored.append((-score, term))
+                if limit is None:
+                    continue
+                if len(best) < limit:
+                    heapq.heappush(best, score)
+                else:
+                    heapq.heappushpop(best, score)
+                if len(best) == limit:
+                    threshold = max(threshold, best[0])
+        return scored
+
+
+def _link_pid(link: str):
+    """Return the pid of a place from its URI (or from the pid itself)."""
+    return link.rstrip('/').rsplit('/', 1)[-1]
+
+
+class GraphIndex():
+    """The connections between places (their 'connectsWith' links), as a
+    compressed sparse row (CSR) adjacency over place ordinals.
+
+    Links are undirected: a place is connected to the places it links to
+    and to those that link to it. Links to places that are not in the index
+    are ignored. The links of each place are kept as added, by pid; the CSR
+    arrays, in which the neighbours of ordinal n are the ascending
+    targets[offsets[n]:offsets[n + 1]], are rebuilt from them only when the
+    first query after a change needs them.
+    """
+
+    def __init__(self):
+        # pid -> ordinal of every place added, linked or not
+        self.nodes = {}
+        # ordinal -> the pids it links to
+        self.links = {}
+        self.offsets = array('I', [0])
+        self.targets = array('I')
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, n: int, pid: str, links: list):
+        old = self.nodes.get(pid)
+        if old is not None and old != n:
+            self.links.pop(old, None)
+        self.nodes[pid] = n
+        links = tuple([_link_pid(link) for link in links])
+        if len(links) > 0:
+            self.links[n] = links
+        else:
+            self.links.pop(n, None)
+        self._dirty = True
+
+    def remove(self, pid: str):
+        try:
+            n = self.nodes.pop(pid)
+        except KeyError:
+            return
+        self.links.pop(n, None)
+        self._dirty = True
+
+    def merge(self, other, mapping=None):
+        """Add the places and links of another GraphIndex, mapping its
+        ordinals as _join_postings() does."""
+        for pid, n in other.nodes.items():
+            m = n if mapping is None else mapping[n]
+            self.nodes[pid] = m
+            try:
+                self.links[m] = other.links[n]
+            except KeyError:
+                pass
+        self._dirty = True
+
+    def _compile(self):
+        if not self._dirty:
+            return
+        nodes = self.nodes
+        edges = set()
+        for n, links in self.links.items():
+            for pid in links:
+                m = nodes.get(pid)
+                if m is not None and m != n:
+                    edges.add((n, m))
+                    edges.add((m, n))
+        edges = sorted(edges)
+        size = max(nodes.values()) + 1 if len(nodes) > 0 else 0
+        offsets = array('I', [0]) * (size + 1)
+        for n, m in edges:
+            offsets[n + 1] += 1
+        for n in range(size):
+            offsets[n + 1] += offsets[n]
+        self.offsets = offsets
+        self.targets = array('I', [m for n, m in edges])
+        self._dirty = False
+        logger.debug('Compiled graph of {} places and {} links'.format(
+            len(nodes), len(edges) // 2))
+
+    def neighbors(self, n: int):
+        """Return the ordinals connected to n, in ascending order."""
+        self._compile()
+        if n + 1 >= len(self.offsets):
+            return self.targets[0:0]
+        return self.targets[self.offsets[n]:self.offsets[n + 1]]
+
+    def within(self, n: int, hops: int):
+        """Return the ordinals at most hops links away from n (n excepted),
+        nearest first and in ascending order at each distance."""
+        seen = {n}
+        frontier = [n]
+        found = []
+        for i in range(hops):
+            layer = set()
+            for m in frontier:
+                for t in self.neighbors(m):
+                    if t not in seen:
+                        seen.add(t)
+                        layer.add(t)
+            if len(layer) == 0:
+                break
+            frontier = sorted(layer)
+            found.extend(frontier)
+        return found
+
+    def path(self, start: int, end: int):
+        """Return the ordinals on a shortest path from start to end, both
+        included, or [] if they are not connected.
+
+        The search runs outwards from both ends in turn, always extending
+        the smaller frontier by one whole layer.
+        """
+        if start == end:
+            return [start]
+        # ordinal -> (the ordinal it was reached from, distance)
+        ahead = {start: (None, 0)}
+        behind = {end: (None, 0)}
+        front = [start]
+        back = [end]
+        while len(front) > 0 and len(back) > 0:
+            if len(front) <= len(back):
+                front, meet = self._extend(front, ahead, behind)
+            else:
+                back, meet = self._extend(back, behind, ahead)
+            if meet is not None:
+                path = []
+                while meet is not None:
+                    path.append(meet)
+                    meet = ahead[meet][0]
+                path.reverse()
+                meet = behind[path[-1]][0]
+                while meet is not None:
+                    path.append(meet)
+                    meet = behind[meet][0]
+                return path
+        return []
+
+    def _extend(self, frontier: list, seen: dict, other: dict):
+        """Add the next layer to one side of a path search; return it, with
+        the ordinal through which it meets the other side (if it does) on
+        the shortest path."""
+        layer = []
+        meet = None
+        best = None
+        for m in frontier:
+            depth = seen[m][1] + 1
+            for t in self.neighbors(m):
+                if t in seen:
+                    continue
+                seen[t] = (m, depth)
+                layer.append(t)
+                if t in other and (best is None or other[t][1] < best):
+                    meet = t
+                    best = other[t][1]
+        return (layer, meet)
+
+
+# the top-level keys of a place document that PlaceCollection relies on
+INDEX_KEYS = [
+    '@type', 'id', 'title', 'description', 'names', 'created', 'history',
+    'locations', 'reprPoint', 'placeTypes', 'review_state', 'subject',
+    'connectsWith']
+
+
+class BasePlace():
+    """The fields of a place, read from its 'data' attribute (the decoded
+    JSON document), which subclasses provide.
+
+    Subclasses declare __slots__, as this class does, so that places carry
+    no instance dictionary.
+    """
+
+    __slots__ = ()
+
+    @staticmethod
+    def _check_type(attributes: dict):
         try:
             e_type = attributes['@type']
         except KeyError:
@@ -35,7 +744,52 @@ class Place():
                     '"@type" attribute` passed to Place constructor had '
                     'unexpected value = "{}". Expected "Place".'
                     ''.format(e_type))
-        self.data = attributes
+
+    # the fields used for indexing, which CompactPlace keeps in memory
+
+    @property
+    def id(self):
+        return self.data['id']
+
+    @property
+    def title(self):
+        return self.data['title']
+
+    @property
+    def names(self):
+        return self.data['names']
+
+    @property
+    def created(self):
+        return self.data['created']
+
+    @property
+    def history(self):
+        return self.data['history']
+
+    @property
+    def locations(self):
+        return self.data['locations']
+
+    @property
+    def reprPoint(self):
+        return self.data.get('reprPoint')
+
+    @property
+    def placeTypes(self):
+        return self.data.get('placeTypes', [])
+
+    @property
+    def review_state(self):
+        return self.data.get('review_state')
+
+    @property
+    def subject(self):
+        return self.data.get('subject', [])
+
+    @property
+    def connectsWith(self):
+        return self.data.get('connectsWith', [])
 
     def __str__(self):
         return """https://pleiades.stoa.org/places/{id}
@@ -44,23 +798,163 @@ class Place():
 """.format(**self.data)
 
 
+class Place(BasePlace):
+
+    __slots__ = ('data',)
+
+    def __init__(self, attributes: dict):
+        self._check_type(attributes)
+        self.data = attributes
+
+
+def _stamps(events: list):
+    return [{'modified': e['modified']} for e in events]
+
+
+class CompactPlace(BasePlace):
+    """A place that keeps only the fields needed for indexing in memory.
+
+    The full JSON document is read from the source file again (or from
+    'length' bytes at 'offset' within it) each time the 'data' attribute is
+    accessed, and is not retained.
+    """
+
+    __slots__ = (
+        'id', 'title', 'names', 'created', 'history', 'locations',
+        'reprPoint', 'placeTypes', 'review_state', 'subject',
+        'connectsWith', 'source', 'offset', 'length')
+
+    def __init__(
+            self, attributes: dict, source: str, offset=None, length=None):
+        self._check_type(attributes)
+        self.id = attributes['id']
+        self.title = attributes['title']
+        self.names = [
+            {
+                'attested': n['attested'],
+                'romanized': n['romanized'],
+                'created': n['created'],
+                'history': _stamps(n['history'])
+            } for n in attributes['names']]
+        self.created = attributes['created']
+        self.history = _stamps(attributes['history'])
+        self.locations = [
+            {
+                'created': l['created'],
+                'history': _stamps(l['history'])
+            } for l in attributes['locations']]
+        self.reprPoint = attributes.get('reprPoint')
+        self.placeTypes = attributes.get('placeTypes', [])
+        self.review_state = attributes.get('review_state')
+        self.subject = attributes.get('subject', [])
+        self.connectsWith = attributes.get('connectsWith', [])
+        self.source = source
+        self.offset = offset
+        self.length = length
+
+    @property
+    def data(self):
+        with open(self.source, 'rb') as f:
+            if self.offset is None:
+                raw = f.read()
+            else:
+                f.seek(self.offset)
+                raw = f.read(self.length)
+        del f
+        return json.loads(raw)
+
+
+def iter_places(source):
+    """Return an iterable of the places in a PlaceCollection, a walker
+    (whose iter_places() loads them as they are needed) or an iterable."""
+    if isinstance(source, PlaceCollection):
+        return source.places
+    if hasattr(source, 'iter_places'):
+        return source.iter_places()
+    return source
+
+
+# the places, in ordinal order, and ordinals handed to each worker process
+# by PlaceCollection.build_indices()
+_builder_places = None
+_builder_ordinals = None
+
+
+def _init_builder(places: list, ordinals: dict):
+    global _builder_places, _builder_ordinals
+    _builder_places = places
+    _builder_ordinals = ordinals
+
+
+def _build_shard(shard: tuple, which: list):
+    """Build indices over the places in the range shard in a worker process;
+    return them with the most recent modification date."""
+    start, stop = shard
+    pc = PlaceCollection()
+    pc.ordinals = _builder_ordinals
+    for it in which:
+        for place in _builder_places[start:stop]:
+            pc._index(it, place)
+    return ({it: pc.indices[it] for it in which}, pc.most_recent)
+
+
 class PlaceCollection():
 
+    # queries answered from an index with a different name
+    QUERY_INDICES = {
+        'modified_between': 'modified',
+        'modified_since': 'modified',
+        'bbox': 'spatial',
+        'nearest': 'spatial',
+        'name_prefix': 'name_search',
+        'name_fuzzy': 'name_search',
+        'neighbors': 'graph',
+        'hops': 'graph',
+        'path': 'graph'
+    }
+
+    # indices of top-level attributes whose value is a string or a list of
+    # strings, posted under each string as it is
+    ATTRIBUTE_INDICES = ['placeTypes', 'review_state', 'subject']
+
+    # the minimum similarity (Dice coefficient of trigrams) of the tokens
+    # matched by get('name_fuzzy', ...)
+    FUZZY_THRESHOLD = 0.3
+
     def __init__(self, place_list=[], index_on_add=False):
         self.places = []
         self.index_on_add = index_on_add
-        self.indices = {
+        self.indices = self._new_indices()
+        self.most_recent = '19700101'
+        # postings in the name, in_name and last_modified indices are sorted
+        # arrays of place ordinals, which map to pids through self.pids; a
+        # pid keeps its ordinal when its place is removed, for whichever
+        # place with that pid is added next
+        self.pids = []
+        self.ordinals = {}
+        # index build and query timings (see pleiades.walker.stats)
+        self.stats = Stats()
+        for place in place_list:
+            self.add_place(place)
+
+    @staticmethod
+    def _new_indices():
+        return {
             'id': {},
             'name': {},
             'last_modified': {},
-            'in_name': {}
+            'in_name': {},
+            'modified': StampIndex(),
+            'spatial': SpatialIndex(),
+            'name_search': NameSearchIndex(),
+            'placeTypes': {},
+            'review_state': {},
+            'subject': {},
+            'graph': GraphIndex()
         }
-        self.most_recent = '19700101'
-        for place in place_list:
-            self.add_place(place)
 
     def add_place(self, place):
-        if isinstance(place, Place):
+        if isinstance(place, BasePlace):
             self.places.append(place)
         elif isinstance(place, dict):
             self.places.append(Place(place))
@@ -69,48 +963,198 @@ class PlaceCollection():
                 'Unexpected argument type for PlaceCollection.add_place(): '
                 '"{}". Expected "Place" or "dict".'.format(type(place)))
         if self.index_on_add:
-            index_titles = [k for k in self.indices.keys() if k != 'words']
+            self._index_new(len(self.places) - 1)
+
+    def extend(self, *sources):
+        """Add places in bulk from PlaceCollections or iterables of places.
+
+        Places held by a PlaceCollection are appended as they are, without
+        passing each one through add_place(). When index_on_add is set, only
+        the newly added places are indexed.
+        """
+        start = len(self.places)
+        for source in sources:
+            if isinstance(source, PlaceCollection):
+                self.places.extend(source.places)
+            else:
+                for place in source:
+                    if isinstance(place, BasePlace):
+                        self.places.append(place)
+                    elif isinstance(place, dict):
+                        self.places.append(Place(place))
+                    else:
+                        raise ValueError(
+                            'Unexpected argument type for '
+                            'PlaceCollection.extend(): "{}". Expected '
+                            '"Place" or "dict".'.format(type(place)))
+        if self.index_on_add:
+            self._index_new(start)
+        return self
+
+    def merge(self, *others):
+        """Add the places of other PlaceCollections, with their indices.
+
+        This combines the collections walked from the shards of a tree (see
+        the 'shard' argument of Walker), which should hold disjoint sets of
+        places. Places are appended in the order given.
+
+        An index that is built on any of the collections (or on all of
+        them, when index_on_add is set) is carried over: the postings of
+        the others are mapped to this collection's ordinals and joined,
+        without indexing their places again, and only the places of
+        collections on which it is empty are indexed here. Any other index
+        is left empty, to be built on first use.
+        """
+        others = [o for o in others if len(o.places) > 0]
+        holders = others + ([self] if len(self.places) > 0 else [])
+        if len(holders) == 0:
+            return self
+        kept = [
+            it for it in self.indices
+            if self.index_on_add or any(
+                len(pc.indices[it]) > 0 for pc in holders)]
+        start = perf_counter()
+        for it in kept:
+            if len(self.indices[it]) == 0:
+                for place in self.places:
+                    self._index(it, place)
+        for other in others:
+            self.places.extend(other.places)
+            mapping = [self._ordinal(pid) for pid in other.pids]
+            for it in kept:
+                index = self.indices[it]
+                theirs = other.indices[it]
+                if len(theirs) == 0:
+                    for place in other.places:
+                        self._index(it, place)
+                elif it == 'id':
+                    index.update(theirs)
+                elif isinstance(index, dict):
+                    _join_postings(index, theirs, mapping)
+                else:
+                    index.merge(theirs, mapping)
+            if other.most_recent > self.most_recent:
+                self.most_recent = other.most_recent
+        logger.info(
+            'Merged {} collections, carrying over {} indices, in {:.3f} '
+            's'.format(
+                len(others), len(kept), perf_counter() - start))
+        return self
+
+    def _index_new(self, start: int):
+        index_titles = [k for k in self.indices.keys() if k != 'words']
+        for place in self.places[start:]:
             for it in index_titles:
-                self._index(it, self.places[-1])
+                self._index(it, place)
+
+    def update_places(self, remove=[], add=[]):
+        """Remove places by pid and add new ones, keeping indices current.
+
+        Every index that has already been built is updated for just the
+        removed and added places rather than being rebuilt.
+        """
+        built = [it for it in self.indices if len(self.indices[it]) > 0]
+        self.remove_places(remove)
+        start = len(self.places)
+        self.extend(add)
+        if not self.index_on_add:
+            for place in self.places[start:]:
+                for it in built:
+                    self._index(it, place)
+
+    def remove_places(self, pids):
+        """Remove the places with the given pids from the collection."""
+        pids = set(pids)
+        if len(pids) == 0:
+            return
+        removed = [p for p in self.places if p.id in pids]
+        self.places = [p for p in self.places if p.id not in pids]
+        for place in removed:
+            self._unindex(place)
 
     def _index(self, it, place=None):
         # logger.debug('index {}'.format(it))
         index = self.indices[it]
         if it == 'id':
-            index[place.data['id']] = place
+            index[place.id] = place
             # logger.debug(index)
+        elif it == 'in_name' and place is not None:
+            self._do_index_in_name(self._names(place), place.id)
+        elif it in self.ATTRIBUTE_INDICES:
+            self._do_index_attribute(it, place)
         else:
             if place is not None:
                 getattr(self, '_do_index_{}'.format(it))(place)
             else:
                 getattr(self, '_do_index_{}'.format(it))()
 
-    def _do_index_name(self, place):
-        index = self.indices['name']
-        names = place.data['title'].split('/')
-        for name in place.data['names']:
+    def _unindex(self, place):
+        pid = place.id
+        if self.indices['id'].get(pid) is place:
+            del self.indices['id'][pid]
+        try:
+            n = self.ordinals[pid]
+        except KeyError:
+            return
+        names = self._names(place)
+        name_tokens = self._name_tokens(names)
+        in_name_tokens = self._in_name_tokens(names)
+        self.indices['name_search'].remove(
+            set(name_tokens) | set(in_name_tokens), n)
+        for it, tokens in [
+                ('name', name_tokens),
+                ('in_name', in_name_tokens),
+                ('last_modified', [self._latest(place)])] + [
+                    (it, self._attribute_values(place, it))
+                    for it in self.ATTRIBUTE_INDICES]:
+            index = self.indices[it]
+            for token in tokens:
+                try:
+                    entry = index[token]
+                except KeyError:
+                    continue
+                _unpost(entry, n)
+                if len(entry) == 0:
+                    del index[token]
+        self.indices['modified'].remove(self._latest_stamp(place), n)
+        self.indices['spatial'].remove(n)
+        self.indices['graph'].remove(pid)
+        date_index = self.indices['last_modified']
+        if self.most_recent not in date_index:
+            if len(date_index) > 0:
+                self.most_recent = max(date_index.keys())
+            else:
+                self.most_recent = '19700101'
+
+    def _ordinal(self, pid: str):
+        try:
+            return self.ordinals[pid]
+        except KeyError:
+            n = len(self.pids)
+            self.pids.append(pid)
+            self.ordinals[pid] = n
+            return n
+
+    def _places(self, entry: array):
+        pid_index = self.indices['id']
+        pids = self.pids
+        return [pid_index[pids[n]] for n in entry]
+
+    def _names(self, place):
+        names = place.title.split('/')
+        for name in place.names:
             if name['attested'] is not None:
                 names.append(name['attested'])
             names.extend(name['romanized'].split(','))
-        names = [n.strip() for n in names if n is not None and n.strip() != '']
-        tokens = [self._tokenize(n) for n in names]
-        tokens = list(set(tokens))
-        tokens = [t for t in tokens if not (
+        return [
+            n.strip() for n in names if n is not None and n.strip() != '']
+
+    def _name_tokens(self, names: list):
+        tokens = tokenize_many(names)
+        return [t for t in tokens if not (
             t.startswith('untitled') or t.startswith('unnamed'))]
-        pid = place.data['id']
-        for token in tokens:
-            try:
-                entry = index[token]
-            except KeyError:
-                index[token] = []
-                entry = index[token]
-            finally:
-                if pid not in entry:
-                    entry.append(pid)
-            self._do_index_in_name(names, pid)
 
-    def _do_index_in_name(self, names: list, pid: str):
-        index = self.indices['in_name']
+    def _in_name_tokens(self, names: list):
         words = []
         for name in names:
             if ' ' in name:
@@ -119,106 +1163,258 @@ class PlaceCollection():
                     if p != '' and p[0] != p[0].lower()]
                 words.extend([' '.join(p) for p in name_parts])
         try:
-            tokens = [self._tokenize(w) for w in words]
+            tokens = tokenize_many(words)
         except AttributeError:
             print(words)
             raise
-        tokens = list(set(tokens))
-        tokens = [t for t in tokens if t not in ['untitled', 'unnamed']]
-        for token in tokens:
-            try:
-                entry = index[token]
-            except KeyError:
-                index[token] = []
-                entry = index[token]
-            finally:
-                if pid not in entry:
-                    entry.append(pid)
+        return [t for t in tokens if t not in ['untitled', 'unnamed']]
 
-    def _do_index_last_modified(self, place):
-        index = self.indices['last_modified']
-        stamps = [place.data['created']]
-        for event in place.data['history']:
+    def _latest(self, place):
+        stamp = self._latest_stamp(place)
+        return stamp[0:4] + stamp[5:7] + stamp[8:10]
+
+    def _latest_stamp(self, place):
+        stamps = [place.created]
+        for event in place.history:
             stamps.append(event['modified'])
-        for location in place.data['locations']:
+        for location in place.locations:
             stamps.append(location['created'])
             for event in location['history']:
                 stamps.append(event['modified'])
-        for name in place.data['names']:
+        for name in place.names:
             stamps.append(name['created'])
             for event in name['history']:
                 stamps.append(event['modified'])
-        stamps = list(set(stamps))
-        stamps = sorted(stamps, reverse=True)
         try:
-            latest = dateutil.parser.parse(stamps[0]).strftime('%Y%m%d')
+            return normalize_stamp(max(stamps))
         except TypeError:
+            from pprint import pformat
             logger.critical(pformat(place.data))
             raise
+
+    def _do_index_name(self, place):
+        index = self.indices['name']
+        names = self._names(place)
+        tokens = self._name_tokens(names)
+        n = self._ordinal(place.id)
+        for token in tokens:
+            try:
+                entry = index[token]
+            except KeyError:
+                entry = index[token] = array('I')
+            _post(entry, n)
+
+    def _do_index_in_name(self, names: list, pid: str):
+        index = self.indices['in_name']
+        tokens = self._in_name_tokens(names)
+        n = self._ordinal(pid)
+        for token in tokens:
+            try:
+                entry = index[token]
+            except KeyError:
+                entry = index[token] = array('I')
+            _post(entry, n)
+
+    def _do_index_last_modified(self, place):
+        index = self.indices['last_modified']
+        latest = self._latest(place)
         if latest > self.most_recent:
             self.most_recent = latest
         try:
-            index[latest]
+            entry = index[latest]
         except KeyError:
-            index[latest] = []
-        finally:
-            pid = place.data['id']
-            if pid not in index[latest]:
-                index[latest].append(pid)
+            entry = index[latest] = array('I')
+        _post(entry, self._ordinal(place.id))
+
+    def _attribute_values(self, place, it):
+        value = getattr(place, it)
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [value]
+        return value
+
+    def _do_index_attribute(self, it, place):
+        index = self.indices[it]
+        n = self._ordinal(place.id)
+        for value in self._attribute_values(place, it):
+            try:
+                entry = index[value]
+            except KeyError:
+                entry = index[value] = array('I')
+            _post(entry, n)
+
+    def _match_attribute(self, it, value):
+        try:
+            return self.indices[it][value]
+        except KeyError:
+            return []
+
+    def _do_index_modified(self, place):
+        self.indices['modified'].add(
+            self._latest_stamp(place), self._ordinal(place.id))
+
+    def _match_modified_between(self, value):
+        start, end = value
+        if start is not None:
+            start = normalize_stamp(start)
+        if end is not None:
+            end = normalize_stamp(end)
+        return self.indices['modified'].between(start, end)
+
+    def _match_modified_since(self, value):
+        return self.indices['modified'].between(normalize_stamp(value))
+
+    def _do_index_spatial(self, place):
+        point = place.reprPoint
+        if point is None:
+            return
+        self.indices['spatial'].add(
+            self._ordinal(place.id), float(point[0]), float(point[1]))
+
+    def _match_bbox(self, value):
+        minx, miny, maxx, maxy = value
+        return self.indices['spatial'].within(minx, miny, maxx, maxy)
+
+    def _match_nearest(self, value):
+        try:
+            x, y, k = value
+        except ValueError:
+            x, y = value
+            k = 1
+        return self.indices['spatial'].nearest(x, y, k)
+
+    def _do_index_name_search(self, place):
+        names = self._names(place)
+        tokens = set(self._name_tokens(names))
+        tokens.update(self._in_name_tokens(names))
+        self.indices['name_search'].add(tokens, self._ordinal(place.id))
+
+    def _search_value(self, value):
+        if isinstance(value, str):
+            return (value, None)
+        return value
+
+    def _match_name_prefix(self, value):
+        """Ordinals of the places with a name token starting with value (or
+        value[0], with at most value[1] tokens matched), in order."""
+        prefix, limit = self._search_value(value)
+        index = self.indices['name_search']
+        ordinals = set()
+        for term in index.prefixed(self._tokenize(prefix), limit):
+            ordinals.update(index.terms[term])
+        return sorted(ordinals)
 
-    def _get_index_last_modified(self):
+    def _match_name_fuzzy(self, value):
+        """Ordinals of the places with a name token similar to value (or
+        value[0], with at most value[1] places returned), most similar
+        first."""
+        text, limit = self._search_value(value)
+        index = self.indices['name_search']
+        token = self._tokenize(text)
+        # each token matches at least one place, so limit tokens are often
+        # enough; ask for more only if they share places
+        terms = limit
+        while True:
+            similar = index.similar(token, self.FUZZY_THRESHOLD, terms)
+            seen = set()
+            ordinals = []
+            for score, term in similar:
+                for n in index.terms[term]:
+                    if n not in seen:
+                        seen.add(n)
+                        ordinals.append(n)
+            if (limit is None or len(similar) < terms
+                    or len(ordinals) >= limit):
+                break
+            terms *= 2
+        if limit is not None:
+            del ordinals[limit:]
+        return ordinals
+
+    def _do_index_graph(self, place):
+        self.indices['graph'].add(
+            self._ordinal(place.id), place.id, place.connectsWith)
+
+    def _graph_node(self, value: str):
+        return self.indices['graph'].nodes.get(_link_pid(value))
+
+    def _match_neighbors(self, value):
+        """Ordinals of the places connected to the place with pid (or URI)
+        value, in order."""
+        n = self._graph_node(value)
+        if n is None:
+            return []
+        return self.indices['graph'].neighbors(n)
+
+    def _match_hops(self, value):
+        """Ordinals of the places at most value[1] connections away from
+        the place value[0], nearest first."""
+        pid, hops = value
+        n = self._graph_node(pid)
+        if n is None:
+            return []
+        return self.indices['graph'].within(n, hops)
+
+    def _match_path(self, value):
+        """Ordinals of the places on a shortest chain of connections from
+        the place value[0] to the place value[1], in path order."""
+        start = self._graph_node(value[0])
+        end = self._graph_node(value[1])
+        if start is None or end is None:
+            return []
+        return self.indices['graph'].path(start, end)
+
+    def _match_last_modified(self, value=None):
         date_index = self.indices['last_modified']
-        pid_index = self.indices['id']
-        return [pid_index[pid] for pid in date_index[self.most_recent]]
+        return date_index[self.most_recent]
 
-    def _get_index_name(self, value):
+    def _match_name(self, value):
         name_index = self.indices['name']
-        pid_index = self.indices['id']
         token = self._tokenize(value)
         try:
-            pids = name_index[token]
+            entry = name_index[token]
         except KeyError:
             return []
-        return [pid_index[pid] for pid in pids]
+        return entry
 
-    def _get_index_in_name(self, value):
+    def _match_in_name(self, value):
         word_index = self.indices['in_name']
         logger.debug(
             'word index contains {} unique terms'.format(len(word_index)))
-        pid_index = self.indices['id']
         token = self._tokenize(value)
         try:
-            pids = word_index[token]
+            entry = word_index[token]
         except KeyError:
             if token == '':
                 raise
             logger.debug('word index MISS for token="{}"'.format(token))
-            logger.debug(
-                'index term context: {}'.format(
-                    sorted(
-                        [w for w in word_index.keys() if w.startswith(
-                            token[0])])))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    'index term context: {}'.format(
+                        sorted(
+                            [w for w in word_index.keys() if w.startswith(
+                                token[0])])))
             return []
         else:
             logger.debug('word index HIT for token="{}": {} results'.format(
-                token, len(pids)))
-        return [pid_index[pid] for pid in pids]
+                token, len(entry)))
+        return entry
 
     def _tokenize(self, raw: str):
-        cooked = raw.strip()
-        cooked = cooked.translate(punct_table)
-        cooked = unidecode.unidecode(cooked)
-        cooked = ''.join(cooked.split()).lower()
-        return cooked
+        return tokenize(raw)
 
     def get(self, it, value=None):
-        if len(self.indices['id']) == 0:
-            logger.info('Constructing pid index ...')
-            for place in self.places:
-                self._index('id', place)
-            logger.info(
-                '... pid indexing complete: {} entries'.format(
-                    len(self.indices['id'])))
+        start = perf_counter()
+        try:
+            return self._get(it, value)
+        finally:
+            name = 'query.{}'.format(it)
+            self.stats.count(name)
+            self.stats.add_time(name, perf_counter() - start)
+
+    def _get(self, it, value=None):
+        self._ensure_index('id')
         if it == 'id':
             try:
                 result = self.indices['id'][value]
@@ -226,24 +1422,121 @@ class PlaceCollection():
                 return []
             else:
                 return [result]
+        return self._places(self._match(it, value))
+
+    def _match(self, it, value=None):
+        """Return the ordinals of the places that get(it, value) returns,
+        building the index it needs first."""
+        self._ensure_index(self.QUERY_INDICES.get(it, it))
+        if it in self.ATTRIBUTE_INDICES:
+            return self._match_attribute(it, value)
+        return getattr(self, '_match_{}'.format(it))(value)
+
+    def query(self, query, limit=None, offset=0):
+        """Return the places matching a compound query, lazily.
+
+        See pleiades.walker.query for how queries are built and planned.
+        """
+        from pleiades.walker.query import QueryResult
+        return QueryResult(self, query, limit=limit, offset=offset)
+
+    def _ensure_index(self, it):
+        """Build index 'it' if it is empty."""
+        if len(self.indices[it]) > 0:
+            return
+        if it != 'id':
+            self._ensure_index('id')
+        start = perf_counter()
+        if it == 'id':
+            logger.info('Constructing pid index ...')
+            for place in self.places:
+                self._index('id', place)
         else:
-            if len(self.indices[it]) == 0:
-                logger.info('Constructing {} index ...'.format(it))
-                for pid, place in self.indices['id'].items():
-                    self._index(it, place)
-                logger.info(
-                    '... {} indexing complete: {} entries'.format(
-                        it, len(self.indices[it])))
-            if value is not None:
-                return getattr(self, '_get_index_{}'.format(it))(value)
-            else:
-                return getattr(self, '_get_index_{}'.format(it))()
+            logger.info('Constructing {} index ...'.format(it))
+            for pid, place in self.indices['id'].items():
+                self._index(it, place)
+        self._built(it, perf_counter() - start)
+
+    def _built(self, it, seconds: float):
+        """Record the build of index it."""
+        entries = len(self.indices[it])
+        logger.info(
+            '... {} indexing complete: {} entries in {:.3f} s'.format(
+                'pid' if it == 'id' else it, entries, seconds))
+        self.stats.add_time('build.{}'.format(it), seconds)
+        self.stats.set('entries.{}'.format(it), entries)
+        self.stats.emit(
+            'build', {'index': it, 'seconds': seconds, 'entries': entries})
+
+    def build_indices(self, which=None, workers=1):
+        """Build indices now, rather than on first use by get().
+
+        - which: the names of the indices to build (by default, all of
+          them); indices that are already built are left alone
+        - workers: the number of worker processes to build them in. 1 (the
+          default) builds them here, one after another; None or 0 means one
+          worker per CPU. Each worker indexes a contiguous share of the
+          places for every index, and the shares are then merged.
+
+        Every place is indexed exactly once for each index. Returns the
+        names of the indices that were built.
+        """
+        if which is None:
+            which = list(self.indices.keys())
+        self._ensure_index('id')
+        which = [
+            it for it in which if it != 'id' and len(self.indices[it]) == 0]
+        if workers is None or workers == 0:
+            workers = cpu_count() or 1
+        workers = min(workers, len(self.places))
+        if workers <= 1 or len(which) == 0:
+            for it in which:
+                self._ensure_index(it)
+            return which
+        from concurrent.futures import ProcessPoolExecutor
+        start = perf_counter()
+        places = sorted(
+            self.indices['id'].values(), key=lambda p: self._ordinal(p.id))
+        size = -(-len(places) // workers)
+        shards = [(i, i + size) for i in range(0, len(places), size)]
+        logger.info('Constructing {} indices in {} worker processes'.format(
+            ', '.join(which), len(shards)))
+        # the places are handed over once per worker (where processes are
+        # forked, without being pickled at all) and each task names a range
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_builder,
+                initargs=(places, self.ordinals)) as executor:
+            results = list(executor.map(
+                _build_shard, shards, [which] * len(shards)))
+        for indices, most_recent in results:
+            for it in which:
+                index = self.indices[it]
+                if isinstance(index, dict):
+                    _join_postings(index, indices[it])
+                else:
+                    index.merge(indices[it])
+            if most_recent > self.most_recent:
+                self.most_recent = most_recent
+        # the indices are built side by side, so each is credited with the
+        # wall-clock time of the whole build
+        seconds = perf_counter() - start
+        for it in which:
+            self._built(it, seconds)
+        return which
+
+    def export_snapshot(self, path: str):
+        """Write a memory-mappable snapshot (see pleiades.walker.snapshot)."""
+        from pleiades.walker.snapshot import write_snapshot
+        return write_snapshot(self, path)
+
+    def export_columns(self, path: str, format='parquet'):
+        """Write the places as column files (see pleiades.walker.columnar)."""
+        from pleiades.walker.columnar import export_columns
+        return export_columns(self, path, format=format)
 
     def __add__(self, *args):
         if len(args) == 0:
             return self
         else:
-            for pc in [a for a in args if isinstance(a, PlaceCollection)]:
-                for p in pc.places:
-                    self.add_place(p)
+            self.extend(*[a for a in args if isinstance(a, PlaceCollection)])
         return self
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compound queries over the indices of a PlaceCollection.
+
+A term, Q(it, value), matches the places that PlaceCollection.get(it, value)
+would return. Terms are combined with & (and), | (or) and ~ (not):
+
+    from pleiades.walker.query import Q
+    q = (
+        Q('in_name', 'Superior') & Q('placeTypes', 'province')
+        & ~Q('review_state', 'drafting'))
+    for place in pc.query(q, limit=10):
+        ...
+
+Terms are answered with sets of place ordinals. An 'and' starts from the
+term expected to match fewest places and narrows that set with each of the
+others in turn, most selective first. Once few candidates remain, large
+posting lists are probed by binary search rather than read in full, and
+'bbox' and 'modified_*' terms are checked against each candidate rather
+than run as range queries. Matching places are returned in collection
+order.
+"""
+
+from bisect import bisect_left
+import logging
+from pleiades.walker.entities import normalize_stamp
+
+logger = logging.getLogger(__name__)
+
+# terms whose matches are a posting list that is looked up, not computed
+LOOKUPS = [
+    'id', 'name', 'in_name', 'last_modified', 'placeTypes', 'review_state',
+    'subject']
+
+# terms whose matches are not returned in collection order
+RANKED = [
+    'modified_between', 'modified_since', 'nearest', 'name_fuzzy', 'hops',
+    'path']
+
+# a term is checked place by place, instead of being run as a query, once
+# the candidates are fewer than 1 / FILTER_RATIO of the collection
+FILTER_RATIO = 8
+
+
+class Query():
+    """The base class of terms and their combinations."""
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Q(Query):
+    """The places that PlaceCollection.get(it, value) returns."""
+
+    def __init__(self, it, value=None):
+        self.it = it
+        self.value = value
+
+    def __repr__(self):
+        return 'Q({!r}, {!r})'.format(self.it, self.value)
+
+
+class And(Query):
+    """The places matching every one of terms."""
+
+    def __init__(self, *terms):
+        self.terms = []
+        for term in terms:
+            if isinstance(term, And):
+                self.terms.extend(term.terms)
+            else:
+                self.terms.append(term)
+
+    def __repr__(self):
+        return '({})'.format(' & '.join([repr(t) for t in self.terms]))
+
+
+class Or(Query):
+    """The places matching any of terms."""
+
+    def __init__(self, *terms):
+        self.terms = []
+        for term in terms:
+            if isinstance(term, Or):
+                self.terms.extend(term.terms)
+            else:
+                self.terms.append(term)
+
+    def __repr__(self):
+        return '({})'.format(' | '.join([repr(t) for t in self.terms]))
+
+
+class Not(Query):
+    """The places not matching term."""
+
+    def __init__(self, term):
+        self.term = term
+
+    def __repr__(self):
+        return '~{!r}'.format(self.term)
+
+
+class QueryResult():
+    """The places matching a query, evaluated when first used.
+
+    Iterating over a result yields places in collection order, skipping the
+    first 'offset' and stopping after 'limit' of them.
+    """
+
+    def __init__(self, pc, query, limit=None, offset=0):
+        self.pc = pc
+        self.query = query
+        self.limit = limit
+        self.offset = offset
+        self._ordinals = None
+
+    @property
+    def ordinals(self):
+        if self._ordinals is None:
+            matched = sorted(evaluate(self.pc, self.query))
+            if self.limit is None:
+                self._ordinals = matched[self.offset:]
+            else:
+                self._ordinals = matched[
+                    self.offset:self.offset + self.limit]
+            logger.debug('{} matched {} places'.format(
+                self.query, len(matched)))
+        return self._ordinals
+
+    def ids(self):
+        """Return the pids of the matching places."""
+        pids = self.pc.pids
+        return [pids[n] for n in self.ordinals]
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __iter__(self):
+        pid_index = self.pc.indices['id']
+        pids = self.pc.pids
+        for n in self.ordinals:
+            yield pid_index[pids[n]]
+
+    def __getitem__(self, i):
+        pid_index = self.pc.indices['id']
+        pids = self.pc.pids
+        if isinstance(i, slice):
+            return [pid_index[pids[n]] for n in self.ordinals[i]]
+        return pid_index[pids[self.ordinals[i]]]
+
+
+def evaluate(pc, query):
+    """Return the set of ordinals of the places in pc matching query."""
+    if isinstance(query, Q):
+        return set(_matches(pc, query))
+    if isinstance(query, Or):
+        matched = set()
+        for term in query.terms:
+            matched.update(evaluate(pc, term))
+        return matched
+    if isinstance(query, Not):
+        return _universe(pc) - evaluate(pc, query.term)
+    if isinstance(query, And):
+        terms = _plan(pc, query.terms)
+        first = terms[0]
+        if isinstance(first, Not):
+            candidates = _universe(pc)
+        else:
+            candidates = evaluate(pc, first)
+            terms = terms[1:]
+        return _narrow(pc, terms, candidates)
+    raise ValueError(
+        'Unexpected query type "{}". Expected Q, And, Or or Not.'.format(
+            type(query)))
+
+
+def _universe(pc):
+    pc._ensure_index('id')
+    return {pc._ordinal(pid) for pid in pc.indices['id']}
+
+
+def _matches(pc, term: Q):
+    """Return the ordinals matched by a single term, in ascending order."""
+    if term.it == 'id':
+        pc._ensure_index('id')
+        if term.value in pc.indices['id']:
+            return [pc._ordinal(term.value)]
+        return []
+    ordinals = pc._match(term.it, term.value)
+    if term.it in RANKED:
+        return sorted(ordinals)
+    return ordinals
+
+
+def _estimate(pc, query):
+    """Return an upper bound on the number of places matching query."""
+    if isinstance(query, Q):
+        if query.it in LOOKUPS:
+            return len(_matches(pc, query))
+        if query.it == 'nearest' and len(query.value) == 3:
+            return query.value[2]
+        return len(pc.places)
+    if isinstance(query, And):
+        return min([_estimate(pc, t) for t in query.terms])
+    if isinstance(query, Or):
+        return min(
+            len(pc.places), sum([_estimate(pc, t) for t in query.terms]))
+    return len(pc.places)
+
+
+def _plan(pc, terms: list):
+    """Order the terms of an 'and', most selective first and negations
+    last."""
+    return sorted(terms, key=lambda t: (
+        isinstance(t, Not), _estimate(pc, t)))
+
+
+def _narrow(pc, terms: list, candidates: set):
+    """Return the candidates that match every one of terms."""
+    for term in terms:
+        if len(candidates) == 0:
+            break
+        candidates = _restrict(pc, term, candidates)
+    return candidates
+
+
+def _restrict(pc, query, candidates: set):
+    """Return the candidates that match query."""
+    if isinstance(query, Not):
+        return candidates - _restrict(pc, query.term, candidates)
+    if isinstance(query, And):
+        return _narrow(pc, _plan(pc, query.terms), candidates)
+    if isinstance(query, Or):
+        matched = set()
+        for term in query.terms:
+            matched.update(_restrict(pc, term, candidates - matched))
+        return matched
+    if (
+            query.it in FILTERS
+            and len(candidates) * FILTER_RATIO < len(pc.places)):
+        return FILTERS[query.it](pc, query.value, candidates)
+    entry = _matches(pc, query)
+    if len(candidates) * FILTER_RATIO < len(entry):
+        return {n for n in candidates if _contains(entry, n)}
+    return candidates.intersection(entry)
+
+
+def _contains(entry, n: int):
+    i = bisect_left(entry, n)
+    return i < len(entry) and entry[i] == n
+
+
+def _filter_bbox(pc, value, candidates: set):
+    minx, miny, maxx, maxy = value
+    pc._ensure_index('spatial')
+    index = pc.indices['spatial']
+    xs = index.xs
+    ys = index.ys
+    # comparisons with the NaN of a place without a point are all false
+    return {
+        n for n in candidates
+        if n < len(xs) and minx <= xs[n] <= maxx and miny <= ys[n] <= maxy}
+
+
+def _filter_modified(pc, start, end, candidates: set):
+    if start is not None:
+        start = normalize_stamp(start)
+    if end is not None:
+        end = normalize_stamp(end)
+    pc._ensure_index('id')
+    pid_index = pc.indices['id']
+    pids = pc.pids
+    matched = set()
+    for n in candidates:
+        stamp = pc._latest_stamp(pid_index[pids[n]])
+        if start is not None and stamp < start:
+            continue
+        if end is not None and stamp >= end:
+            continue
+        matched.add(n)
+    return matched
+
+
+# terms that can be checked against each candidate: it -> function
+FILTERS = {
+    'bbox': _filter_bbox,
+    'modified_since': lambda pc, value, candidates: _filter_modified(
+        pc, value, None, candidates),
+    'modified_between': lambda pc, value, candidates: _filter_modified(
+        pc, value[0], value[1], candidates)
+}
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Binary snapshots of a PlaceCollection that are queried in place via mmap.
+
+A snapshot file holds, in 8-byte aligned sections:
+
+- a place table: the JSON document of each place, stored as raw bytes
+  addressed by parallel offset ('Q') and length ('I') columns
+- a string pool holding every index key
+- for each index ('id', 'name', 'in_name', 'last_modified'): its keys in
+  sorted UTF-8 byte order, as offset/length columns into the pool, and the
+  start/length of each key's postings, which are place table rows ('I')
+
+A Snapshot opened read-only looks keys up by binary search directly in the
+mapped file, and only decodes the documents of the places it returns. All
+processes that open the same snapshot share one page-cached copy.
+"""
+
+from array import array
+import json
+import logging
+import mmap
+from pleiades.walker.decoders import get_decoder
+from pleiades.walker.entities import Place, tokenize
+import struct
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PLWSNAP1'
+INDICES = ['id', 'name', 'in_name', 'last_modified']
+_SECTION = struct.Struct('<32sQQ')
+_COUNT = struct.Struct('<I')
+
+
+def _align(n: int):
+    return (n + 7) // 8 * 8
+
+
+def write_snapshot(pc, path: str):
+    """Write the PlaceCollection pc, building any missing index, to path."""
+    for it in INDICES:
+        pc._ensure_index(it)
+    id_index = pc.indices['id']
+    pids = list(id_index.keys())
+    rows = {pid: row for row, pid in enumerate(pids)}
+    sections = []
+
+    docs = bytearray()
+    doc_offsets = array('Q')
+    doc_lengths = array('I')
+    for pid in pids:
+        raw = json.dumps(
+            id_index[pid].data, ensure_ascii=False,
+            separators=(',', ':')).encode('utf-8')
+        doc_offsets.append(len(docs))
+        doc_lengths.append(len(raw))
+        docs.extend(raw)
+    sections.extend([
+        ('docs', bytes(docs)),
+        ('doc_offsets', doc_offsets.tobytes()),
+        ('doc_lengths', doc_lengths.tobytes()),
+        ('most_recent', pc.most_recent.encode('utf-8'))])
+    del docs
+
+    pool = bytearray()
+    for it in INDICES:
+        if it == 'id':
+            entries = [(pid.encode('utf-8'), [rows[pid]]) for pid in pids]
+        else:
+            entries = [
+                (key.encode('utf-8'), [rows[pc.pids[n]] for n in entry])
+                for key, entry in pc.indices[it].items()]
+        entries.sort(key=lambda e: e[0])
+        key_offsets = array('Q')
+        key_lengths = array('I')
+        post_starts = array('Q')
+        post_lengths = array('I')
+        postings = array('I')
+        for key, entry in entries:
+            key_offsets.append(len(pool))
+            key_lengths.append(len(key))
+            pool.extend(key)
+            post_starts.append(len(postings))
+            post_lengths.append(len(entry))
+            postings.extend(sorted(entry))
+        sections.extend([
+            ('{}.koff'.format(it), key_offsets.tobytes()),
+            ('{}.klen'.format(it), key_lengths.tobytes()),
+            ('{}.pstart'.format(it), post_starts.tobytes()),
+            ('{}.plen'.format(it), post_lengths.tobytes()),
+            ('{}.post'.format(it), postings.tobytes())])
+    sections.append(('pool', bytes(pool)))
+
+    offset = _align(len(MAGIC) + _COUNT.size + _SECTION.size * len(sections))
+    table = []
+    for name, blob in sections:
+        table.append(_SECTION.pack(name.encode('ascii'), offset, len(blob)))
+        offset = _align(offset + len(blob))
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_COUNT.pack(len(sections)))
+        f.write(b''.join(table))
+        for name, blob in sections:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(blob)
+    del f
+    logger.info('Wrote snapshot of {} places to {}'.format(len(pids), path))
+    return len(pids)
+
+
+class Snapshot():
+    """A read-only, memory-mapped view of a snapshot written by
+    write_snapshot(), with the same get() interface as PlaceCollection.
+
+    Returned places are decoded with 'decoder' (see
+    pleiades.walker.decoders.get_decoder()).
+    """
+
+    def __init__(self, path: str, decoder=None):
+        self.path = path
+        self._decode = get_decoder(decoder)
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        del f
+        buf = memoryview(self._mmap)
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            buf.release()
+            self._mmap.close()
+            raise ValueError('{} is not a place snapshot'.format(path))
+        count = _COUNT.unpack_from(buf, len(MAGIC))[0]
+        self._sections = {}
+        pos = len(MAGIC) + _COUNT.size
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(buf, pos)
+            pos += _SECTION.size
+            self._sections[name.rstrip(b'\0').decode('ascii')] = (
+                buf[offset:offset + length])
+        self._buf = buf
+        self._docs = self._sections['docs']
+        self._doc_offsets = self._sections['doc_offsets'].cast('Q')
+        self._doc_lengths = self._sections['doc_lengths'].cast('I')
+        self._pool = self._sections['pool']
+        self.most_recent = self._sections['most_recent'].tobytes().decode(
+            'utf-8')
+        self._tables = {}
+        for it in INDICES:
+            self._tables[it] = tuple(
+                self._sections['{}.{}'.format(it, part)].cast(fmt)
+                for part, fmt in [
+                    ('koff', 'Q'), ('klen', 'I'), ('pstart', 'Q'),
+                    ('plen', 'I'), ('post', 'I')])
+
+    def __len__(self):
+        return len(self._doc_offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the mapped views and unmap the file."""
+        for table in self._tables.values():
+            for view in table:
+                view.release()
+        for view in [self._doc_offsets, self._doc_lengths]:
+            view.release()
+        for view in self._sections.values():
+            view.release()
+        self._buf.release()
+        self._mmap.close()
+
+    def get(self, it, value=None):
+        if it == 'last_modified':
+            key = self.most_recent
+        elif it == 'id':
+            key = value
+        else:
+            key = tokenize(value)
+        return [self._place(row) for row in self._rows(it, key)]
+
+    def _rows(self, it, key: str):
+        """Return the place table rows posted under key in index it."""
+        key_offsets, key_lengths, post_starts, post_lengths, postings = (
+            self._tables[it])
+        target = key.encode('utf-8')
+        pool = self._pool
+        lo = 0
+        hi = len(key_offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = key_offsets[mid]
+            if pool[start:start + key_lengths[mid]].tobytes() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(key_offsets):
+            return []
+        start = key_offsets[lo]
+        if pool[start:start + key_lengths[lo]].tobytes() != target:
+            return []
+        start = post_starts[lo]
+        return postings[start:start + post_lengths[lo]].tolist()
+
+    def _place(self, row: int):
+        start = self._doc_offsets[row]
+        return Place(self._decode(
+            self._docs[start:start + self._doc_lengths[row]].tobytes()))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Counters and timers for the phases of a walk and of index builds."""
+
+from contextlib import contextmanager
+import logging
+from threading import Lock
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class Stats():
+    """Counters, timers and gauges, with an optional callback.
+
+    - counters: name -> a number that accumulates (e.g. 'files', 'bytes')
+    - timers: name -> seconds that accumulate (e.g. 'load', 'decode'). A
+      timer run by several threads at once accumulates their busy time,
+      which may exceed the wall-clock time.
+    - gauges: name -> a value that is set rather than accumulated (e.g.
+      'entries.name', the size of an index)
+
+    If 'callback' is set, it is called as callback(event, fields) at the end
+    of each walk, update and index build, with a dictionary describing it.
+    Updates are thread-safe. Stats are picklable, without their callback.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.counters = {}
+        self.timers = {}
+        self.gauges = {}
+        self._lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['callback'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def count(self, name: str, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def set(self, name: str, value):
+        self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time the body of a with statement."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - start)
+
+    def iterate(self, name: str, iterable):
+        """Yield from iterable, timing only the steps taken within it.
+
+        The time is recorded when the iteration ends or is abandoned.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += perf_counter() - start
+                    return
+                elapsed += perf_counter() - start
+                yield item
+        finally:
+            self.add_time(name, elapsed)
+
+    def rate(self, counter: str, timer: str):
+        """Return counter per second of timer, or None if it has not run."""
+        seconds = self.timers.get(timer, 0.0)
+        if seconds == 0.0:
+            return None
+        return self.counters.get(counter, 0) / seconds
+
+    def merge(self, other):
+        """Add the counters and timers of other; take its gauges."""
+        for name, n in other.counters.items():
+            self.count(name, n)
+        for name, seconds in other.timers.items():
+            self.add_time(name, seconds)
+        self.gauges.update(other.gauges)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.gauges = {}
+
+    def as_dict(self):
+        return {
+            'counters': dict(self.counters),
+            'timers': dict(self.timers),
+            'gauges': dict(self.gauges)
+        }
+
+    def emit(self, event: str, fields: dict):
+        """Hand an event to the callback, if there is one."""
+        if self.callback is None:
+            return
+        try:
+            self.callback(event, fields)
+        except Exception:
+            logger.exception('Stats callback failed for "{}"'.format(event))
@@ -2,31 +2,118 @@
 # -*- coding: utf-8 -*-
 """Walk a directory tree and perform customizeable actions."""
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from copy import deepcopy
 import logging
-import json
-from os import walk
-from os.path import abspath, isdir, join, realpath, splitext
-from pleiades.walker.entities import PlaceCollection
+from os import cpu_count, sep, walk
+from os.path import (
+    abspath, isdir, isfile, join, realpath, relpath, splitext)
+from pleiades.walker.bulk import (
+    bulk_format, iter_records, record_pid, SEEKABLE_FORMATS)
+from pleiades.walker.cache import file_stamp, PlaceCache
+from pleiades.walker.decoders import get_decoder, Interner, project
+from pleiades.walker.entities import CompactPlace, PlaceCollection
+from pleiades.walker.stats import Stats
+from time import perf_counter
+from zlib import crc32
 
 logger = logging.getLogger(__name__)
 
+# the walker instance handed to each worker process by _init_worker()
+_worker_walker = None
+
+
+def _init_worker(walker):
+    """Install the walker that this worker process will use for batches."""
+    global _worker_walker
+    _worker_walker = walker
+
+
+def shard_of(key: str, shards: int):
+    """Return the shard, out of 'shards', to which a walker assigns key.
+
+    The assignment depends only on key, so it is the same in every process
+    and on every host.
+    """
+    return crc32(key.encode('utf-8')) % shards
+
+
+def _check_shard(shard):
+    if shard is None:
+        return None
+    try:
+        i, n = shard
+    except (TypeError, ValueError):
+        i = n = None
+    if not (isinstance(i, int) and isinstance(n, int) and 0 <= i < n):
+        raise ValueError(
+            'Unexpected shard {!r}. Expected (i, n) with 0 <= i < n.'.format(
+                shard))
+    return (i, n)
+
+
+def _process_in_worker(root, filenames):
+    """Run the load/clean/do pipeline for one batch in a worker process.
+
+    Returns the result with the stats gathered while producing it.
+    """
+    _worker_walker.stats = Stats()
+    result = _worker_walker._process(root, filenames)
+    return (result, _worker_walker.stats)
+
 
 class Walker():
     """Selectively visit files in a tree and act on them.
 
     The following public methods are available:
 
-    - __init__(): takes two arguments when constructing an instance:
+    - __init__(): takes the following arguments when constructing an instance:
       - path: the path to the root of the subtree that is to be walked
       - extensions: a list of strings, each containing a filename extension
         (including the leading '.') to be considered when acting on files found
         in a directory. An empty extensions argument (the default) means that
         all regular files found will be addressed.
+      - workers: the default number of worker processes used by walk(). 1
+        (the default) walks serially in the calling process; None or 0 means
+        one worker per CPU.
+      - concurrency: the default number of threads that load files while a
+        single-process walk goes on listing directories and acting on the
+        files already loaded. 1 (the default) loads files one at a time.
+        Raising it helps where each file read waits on the network (e.g. on
+        NFS or FUSE-mounted object storage) rather than on the CPU.
+      - shard: None (the default) to walk every file, or a tuple (i, n) to
+        walk only shard i of n. Each file is assigned to a shard by
+        shard_of() its _shard_key(): by default, its path relative to 'path'
+        (with '/' separators), so
+        that n walkers, in any processes or on any hosts, given shards 0 to
+        n - 1 of the same tree between them visit every file exactly once.
+        The results can be combined with PlaceCollection.merge().
 
     - walk(): Walk the directory subtree rooted at the path specified when
       the instance was constructed. For each batch of files considered (see the
       'extensions' argument to __init__()), the internal '_do()' method is
-      called.
+      called. The optional 'workers' argument overrides the instance default.
+      With more than one worker, directory batches are loaded in a process
+      pool and their results are merged in the same order as a serial walk,
+      so the output (including the count) is identical. The optional
+      'concurrency' argument likewise overrides the instance default: each
+      directory's files are then split into chunks of LOAD_CHUNK_SIZE that
+      are passed to '_load()' in a pool of that many threads, and the
+      loaded chunks are joined, in order, before '_clean()' and '_do()' are
+      called on them in the calling thread.
+
+    - iter_batches(): a generator that takes the same arguments as walk() and
+      yields the result of '_do()' for each directory as soon as it has been
+      processed, without merging them. The running count is kept in the
+      'count' attribute.
+
+    The 'stats' attribute (a pleiades.walker.stats.Stats) holds counters and
+    timers for the last walk: 'files', 'bytes' and 'batches'; the time spent
+    listing directories ('list'), in '_load()' (which, for JSON, includes
+    'read' and 'decode'), '_clean()', '_do()' and '_merge()' ('merge'); and
+    the wall-clock time of the whole walk ('walk'). Set 'stats.callback' to
+    receive them at the end of each walk.
 
     The _do() method:
 
@@ -34,19 +121,62 @@ class Walker():
     to the files that walk() finds.
     """
 
-    def __init__(self, path: str, extensions=[]):
+    # the most files passed to one _load() call when loading concurrently
+    LOAD_CHUNK_SIZE = 8
+
+    def __init__(
+            self, path: str, extensions=[], workers=1, concurrency=1,
+            shard=None):
         self.path = abspath(realpath(path))
+        self._check_path()
+        self.count = False
+        self.extensions = [e.lower() for e in extensions]
+        self.workers = workers
+        self.concurrency = concurrency
+        self.shard = _check_shard(shard)
+        self.stats = Stats()
+
+    def _check_path(self):
         if not isdir(self.path):
             raise IOError(
                 '{} is not a valid directory path'.format(self.path))
-        self.count = False
-        self.extensions = [e.lower() for e in extensions]
 
-    def walk(self, count=True):
+    def walk(self, count=True, workers=False, concurrency=False):
+        start = perf_counter()
+        results = list(self.iter_batches(
+            count=count, workers=workers, concurrency=concurrency))
+        with self.stats.timer('merge'):
+            merged = self._merge(results)
+        self.stats.add_time('walk', perf_counter() - start)
+        self._report('walk')
+        return (self.count, merged)
+
+    def iter_batches(self, count=True, workers=False, concurrency=False):
+        """Yield the result of _do() for each directory as it is loaded."""
+        self.stats.reset()
         if count:
             self.count = 0
-        results = None
-        for root, dirs, files in walk(self.path):
+        yield from self._results(
+            self._batches(count), workers, concurrency)
+
+    def _report(self, event: str):
+        """Log a summary of the stats and hand them to the callback."""
+        stats = self.stats
+        rate = stats.rate('files', event)
+        logger.info(
+            '{} of {}: {} files, {} bytes in {:.3f} s{}'.format(
+                event.capitalize(), self.path,
+                stats.counters.get('files', 0),
+                stats.counters.get('bytes', 0),
+                stats.timers.get(event, 0.0),
+                '' if rate is None else ' ({:.0f} files/s)'.format(rate)))
+        fields = stats.as_dict()
+        fields['path'] = self.path
+        stats.emit(event, fields)
+
+    def _batches(self, count=True):
+        """Yield a (root, filenames) tuple for each directory to process."""
+        for root, dirs, files in self.stats.iterate('list', walk(self.path)):
             # logger.debug('at {}: {}'.format(root, repr(files)))
             if len(self.extensions) > 0:
                 select_files = [
@@ -54,17 +184,130 @@ class Walker():
                     in self.extensions]
             else:
                 select_files = files
+            if self.shard is not None:
+                select_files = self._in_shard(root, select_files)
             # logger.debug('selected files: {}'.format(sorted(select_files)))
             if count:
                 self.count += len(select_files)
-            data = self._load(root, select_files)
+            yield (root, select_files)
+
+    def _in_shard(self, root, filenames: list):
+        """Return the filenames in root that belong to this walker's shard."""
+        i, n = self.shard
+        prefix = relpath(root, self.path).replace(sep, '/')
+        if prefix == '.':
+            prefix = ''
+        else:
+            prefix += '/'
+        return [
+            f for f in filenames
+            if shard_of(self._shard_key(prefix + f), n) == i]
+
+    def _shard_key(self, path: str):
+        """Return the key by which the file at path (relative to the root,
+        with '/' separators) is assigned to a shard."""
+        return path
+
+    def _results(self, batches, workers=False, concurrency=False):
+        """Yield the result of _process() for each batch, in batch order."""
+        if workers is False:
+            workers = self.workers
+        if not workers:
+            workers = cpu_count() or 1
+        if concurrency is False:
+            concurrency = self.concurrency
+        if workers == 1 and concurrency > 1:
+            yield from self._concurrent_results(batches, concurrency)
+            return
+        if workers == 1:
+            for root, filenames in batches:
+                yield self._process(root, filenames)
+            return
+        logger.info('Walking {} with {} worker processes'.format(
+            self.path, workers))
+        # keep a bounded number of batches in flight so that results are
+        # handed on as they arrive rather than piling up in memory
+        in_flight = deque()
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(self,)) as executor:
+            for root, filenames in batches:
+                if len(in_flight) >= workers * 4:
+                    yield self._collect(in_flight.popleft())
+                in_flight.append(
+                    executor.submit(_process_in_worker, root, filenames))
+            while len(in_flight) > 0:
+                yield self._collect(in_flight.popleft())
+
+    def _collect(self, future):
+        """Return the result of a batch run in a worker process, keeping its
+        stats."""
+        result, stats = future.result()
+        self.stats.merge(stats)
+        return result
+
+    def _concurrent_results(self, batches, concurrency: int):
+        """Yield the result of _process() for each batch, in batch order,
+        loading files in a pool of threads."""
+        logger.info('Walking {} with {} loader threads'.format(
+            self.path, concurrency))
+        size = self.LOAD_CHUNK_SIZE
+        # as in _results(), bound the chunks in flight so that loaded data
+        # does not pile up ahead of _do()
+        in_flight = deque()
+        chunks_in_flight = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for root, filenames in batches:
+                while chunks_in_flight >= concurrency * 4:
+                    futures = in_flight.popleft()
+                    chunks_in_flight -= len(futures)
+                    yield self._finish(futures)
+                futures = [
+                    executor.submit(
+                        self._timed_load, root, filenames[i:i + size])
+                    for i in range(0, max(len(filenames), 1), size)]
+                chunks_in_flight += len(futures)
+                in_flight.append(futures)
+                self.stats.count('batches')
+                self.stats.count('files', len(filenames))
+            while len(in_flight) > 0:
+                yield self._finish(in_flight.popleft())
+
+    def _timed_load(self, root, filenames):
+        with self.stats.timer('load'):
+            return self._load(root, filenames)
+
+    def _finish(self, futures: list):
+        """Join the data loaded for one batch, then clean and act on it."""
+        data = []
+        for future in futures:
+            data.extend(future.result())
+        with self.stats.timer('clean'):
             data = self._clean(data)
-            result = self._do(data)
-            if results is None:
-                results = result
+        with self.stats.timer('do'):
+            return self._do(data)
+
+    def _merge(self, results: list):
+        """Combine the per-directory results of _do() into one result."""
+        merged = None
+        for result in results:
+            if merged is None:
+                merged = result
             else:
-                results += result
-        return (self.count, results)
+                merged += result
+        return merged
+
+    def _process(self, root, filenames):
+        """Load, clean and act on the files in one directory."""
+        stats = self.stats
+        stats.count('batches')
+        stats.count('files', len(filenames))
+        with stats.timer('load'):
+            data = self._load(root, filenames)
+        with stats.timer('clean'):
+            data = self._clean(data)
+        with stats.timer('do'):
+            return self._do(data)
 
     def _load(self, root, filenames):
         """Perform some action on files at a directory node."""
@@ -87,28 +330,369 @@ class Walker():
 
 class JsonWalker(Walker):
     """A class to crawl a hierarchical directory tree JSON files.
+
+    Files are read as bytes and decoded with 'decoder': the name of one of
+    the backends in pleiades.walker.decoders.BACKENDS, any callable that
+    takes bytes, or None (the default) for the fastest one installed. If
+    'keys' is given, only those top-level keys of each document are kept.
+
+    Instead of a directory, 'path' may name a single bulk file (JSON Lines,
+    a gzipped JSON dump or a tar archive; see pleiades.walker.bulk). Its
+    documents are then read sequentially, BULK_BATCH_SIZE at a time, and
+    each batch is passed to _load() as a list of (name, offset, raw)
+    records in place of filenames. When walking a shard of a bulk file,
+    records are assigned to shards by _record_shard_key() (by default,
+    their name; see bulk.iter_records()) and those of other shards are
+    skipped without being decoded.
+
+    If 'intern' is True, each batch of decoded documents is passed through a
+    pleiades.walker.decoders.Interner, so that equal strings and small
+    records repeated across documents share one object (records being made
+    read-only). The stats then count the objects replaced
+    ('interned') and an estimate of the memory saved ('interned_bytes'),
+    and time the 'intern' step. With worker processes, objects are shared
+    only within the documents of each batch.
     """
 
-    def __init__(self, path):
+    BULK_BATCH_SIZE = 1000
+
+    def __init__(
+            self, path, workers=1, decoder=None, keys=None, concurrency=1,
+            shard=None, intern=False):
         """Initialize the class."""
-        super().__init__(path=path, extensions=['.json'])
+        super().__init__(
+            path=path, extensions=['.json'], workers=workers,
+            concurrency=concurrency, shard=shard)
+        self.decoder = get_decoder(decoder)
+        if keys is None:
+            self.keys = None
+        else:
+            self.keys = list(keys)
+        if intern:
+            self.interner = Interner()
+        else:
+            self.interner = None
+
+    def _check_path(self):
+        self.bulk = bulk_format(self.path)
+        if self.bulk is None or not isfile(self.path):
+            self.bulk = None
+            super()._check_path()
+
+    def _batches(self, count=True):
+        if self.bulk is None:
+            yield from super()._batches(count)
+            return
+        batch = []
+        records = self.stats.iterate('read', iter_records(self.path))
+        if self.shard is not None:
+            i, n = self.shard
+            records = (
+                r for r in records
+                if shard_of(self._record_shard_key(r), n) == i)
+        for record in records:
+            batch.append(record)
+            if len(batch) == self.BULK_BATCH_SIZE:
+                if count:
+                    self.count += len(batch)
+                yield (self.path, batch)
+                batch = []
+        if count:
+            self.count += len(batch)
+        yield (self.path, batch)
+
+    def _record_shard_key(self, record: tuple):
+        """Return the key by which a bulk record is assigned to a shard."""
+        return record[0]
 
     def _load(self, root, filenames):
 
+        stats = self.stats
+        if self.bulk is not None:
+            start = perf_counter()
+            data = [self._decode(raw) for name, offset, raw in filenames]
+            stats.add_time('decode', perf_counter() - start)
+            stats.count('bytes', sum([
+                len(raw) for name, offset, raw in filenames
+                if isinstance(raw, bytes)]))
+            return self._intern(data)
+        # timings are summed here and recorded once per batch, to keep the
+        # cost per file down
+        read = 0.0
+        decode = 0.0
+        size = 0
         data = []
         for filename in filenames:
-            with open(join(root, filename), 'r', encoding='utf-8') as f:
-                data.append(json.load(f))
+            start = perf_counter()
+            with open(join(root, filename), 'rb') as f:
+                raw = f.read()
             del f
+            loaded = perf_counter()
+            data.append(self._decode(raw))
+            read += loaded - start
+            decode += perf_counter() - loaded
+            size += len(raw)
+        stats.add_time('read', read)
+        stats.add_time('decode', decode)
+        stats.count('bytes', size)
+        return self._intern(data)
+
+    def _intern(self, data: list):
+        if self.interner is None:
+            return data
+        start = perf_counter()
+        data, shared, saved = self.interner.intern(data)
+        self.stats.add_time('intern', perf_counter() - start)
+        self.stats.count('interned', shared)
+        self.stats.count('interned_bytes', saved)
         return data
 
+    def _decode(self, raw):
+        if isinstance(raw, bytes):
+            datum = self.decoder(raw)
+        else:
+            datum = raw
+        if self.keys is not None:
+            datum = project(datum, self.keys)
+        return datum
+
 
 class PleiadesWalker(JsonWalker):
     """A class to crawl a hierarchical directory of Pleiades JSON files.
+
+    If a 'cache' file path is given, place data recorded there by an earlier
+    save_cache() is reused for every file whose modification time and size
+    are unchanged, so only new or modified files are parsed. When no file
+    has changed, the indices saved with the cache are restored as well.
+
+    If 'incremental' is True (implied by 'cache'), the walker remembers the
+    modification time and size of every file it walked, so that update() can
+    later bring the resulting PlaceCollection up to date by parsing only the
+    files that have been added or modified since.
+
+    If 'compact' is True, places are loaded as CompactPlace objects, which
+    keep only the fields needed for indexing in memory and re-read the rest
+    of their JSON from the source file on demand. Passing keys=INDEX_KEYS
+    (from pleiades.walker.entities) instead keeps full Place objects whose
+    data holds only the keys that PlaceCollection uses.
+
+    Files and bulk records are assigned to shards by pid: the name of a
+    file without '.json' (as in pleiades-datasets), or the 'id' of a
+    record (see bulk.record_pid()). A place therefore stays in the same
+    shard as others are added or removed, and whether it is walked from a
+    tree, a tar archive or a '.jsonl' file made from it by bulk.pack().
+
+    Besides the stats kept by Walker, 'cached' counts the files read from
+    the cache rather than parsed, and update() records its 'update' time
+    and the numbers of 'added', 'modified' and 'deleted' files. The
+    PlaceCollection returned by walk() reports to the same stats callback.
     """
 
-    def __init__(self, path):
-        super().__init__(path=path)
+    def __init__(
+            self, path, workers=1, cache=None, incremental=False,
+            compact=False, decoder=None, keys=None, concurrency=1,
+            shard=None, intern=False):
+        super().__init__(
+            path=path, workers=workers, decoder=decoder, keys=keys,
+            concurrency=concurrency, shard=shard, intern=intern)
+        self.compact = compact
+        if compact and self.bulk not in [None] + SEEKABLE_FORMATS:
+            raise ValueError(
+                'Compact places cannot be loaded from {}: its documents '
+                'cannot be read back with a seek.'.format(self.path))
+        if self.bulk is not None and (cache is not None or incremental):
+            raise ValueError(
+                'A cache or incremental walk needs a directory tree, not the '
+                'bulk file {}.'.format(self.path))
+        if cache is None:
+            self.cache = None
+        else:
+            self.cache = PlaceCache(
+                cache, self.path, layout=(compact, self.keys))
+        self.incremental = incremental or self.cache is not None
+        self.changes = None
+        self._sources = {}
+        self._unchanged = False
+
+    def __getstate__(self):
+        # worker processes only ever see cache misses and need no history
+        state = self.__dict__.copy()
+        state['cache'] = None
+        state['_sources'] = {}
+        return state
+
+    def walk(self, count=True, workers=False, concurrency=False):
+        count, pc = super().walk(
+            count=count, workers=workers, concurrency=concurrency)
+        if (
+                self._unchanged and pc is not None
+                and self.cache.indices is not None):
+            logger.info('Restoring indices from cache')
+            # each collection gets its own copy, to update as it pleases
+            pc.indices.update(deepcopy(self.cache.indices))
+            pc.most_recent = self.cache.most_recent
+            pc.pids = list(self.cache.pids)
+            pc.ordinals = {pid: n for n, pid in enumerate(pc.pids)}
+        if pc is not None:
+            pc.stats.callback = self.stats.callback
+        return (count, pc)
+
+    def save_cache(self, pc=None):
+        """Save the data from the last walk, and the indices of pc, to cache.
+
+        Pass the PlaceCollection returned by walk() after querying it so that
+        the indices built by its get() calls are stored too.
+        """
+        if self.cache is None:
+            raise ValueError(
+                'PleiadesWalker.save_cache() called on a walker constructed '
+                'without a cache path.')
+        self.cache.save(self._sources, pc)
+
+    def update(self, pc, workers=False, concurrency=False):
+        """Bring pc, the result of an earlier walk, up to date in place.
+
+        Only files added or modified since the previous walk or update are
+        parsed; places from deleted files are dropped. Indices already built
+        on pc are updated rather than rebuilt. The relative paths of the files
+        involved are recorded in the 'changes' attribute.
+        """
+        if not self.incremental:
+            raise ValueError(
+                'PleiadesWalker.update() called on a walker constructed '
+                'without incremental=True or a cache path.')
+        self.stats.reset()
+        start = perf_counter()
+        previous = self._sources
+        sources = {}
+        batches = []
+        for root, filenames in self._batches(count=False):
+            stamped = []
+            for filename in filenames:
+                path = join(root, filename)
+                rel = relpath(path, self.path)
+                stamp = file_stamp(path)
+                try:
+                    old = previous[rel]
+                except KeyError:
+                    old = None
+                if old is not None and old[0] == stamp:
+                    sources[rel] = old
+                else:
+                    stamped.append((filename, rel, stamp))
+            if len(stamped) > 0:
+                batches.append((root, stamped))
+        results = super()._results(
+            [(root, [s[0] for s in stamped]) for root, stamped in batches],
+            workers, concurrency)
+        added = []
+        for (root, stamped), result in zip(batches, results):
+            for (filename, rel, stamp), place in zip(stamped, result.places):
+                sources[rel] = (stamp, place)
+            added.extend(result.places)
+        self.changes = {
+            'added': sorted([r for r in sources if r not in previous]),
+            'modified': sorted([
+                r for r in sources
+                if r in previous and sources[r] is not previous[r]]),
+            'deleted': sorted([r for r in previous if r not in sources])
+        }
+        logger.info(
+            'Updating {}: {} added, {} modified and {} deleted files'.format(
+                self.path, len(self.changes['added']),
+                len(self.changes['modified']), len(self.changes['deleted'])))
+        remove = [
+            previous[r][1].id
+            for r in self.changes['modified'] + self.changes['deleted']]
+        pc.update_places(remove=remove, add=added)
+        self._sources = sources
+        self.count = len(sources)
+        for change, rels in self.changes.items():
+            self.stats.set(change, len(rels))
+        self.stats.add_time('update', perf_counter() - start)
+        self._report('update')
+        return (self.count, pc)
+
+    def _lookup(self, rel, stamp):
+        if self.cache is None:
+            return None
+        return self.cache.lookup(rel, stamp)
+
+    def _results(self, batches, workers=False, concurrency=False):
+        if not self.incremental:
+            yield from super()._results(batches, workers, concurrency)
+            return
+        self._sources = {}
+        self._unchanged = True
+        pending = deque()
+
+        def misses():
+            for root, filenames in batches:
+                stamped = []
+                for filename in filenames:
+                    path = join(root, filename)
+                    rel = relpath(path, self.path)
+                    stamp = file_stamp(path)
+                    stamped.append(
+                        (filename, rel, stamp, self._lookup(rel, stamp)))
+                pending.append(stamped)
+                yield (root, [s[0] for s in stamped if s[3] is None])
+
+        for result in super()._results(misses(), workers, concurrency):
+            stamped = pending.popleft()
+            missed = [s for s in stamped if s[3] is None]
+            self.stats.count('cached', len(stamped) - len(missed))
+            if len(missed) > 0:
+                self._unchanged = False
+            if len(missed) != len(result.places):
+                # _clean() changed the batch, so files cannot be matched to
+                # places: keep the hits and don't cache the parsed files
+                hits = [s[3] for s in stamped if s[3] is not None]
+                yield PlaceCollection(hits).extend(result)
+                continue
+            parsed = iter(result.places)
+            pc = PlaceCollection()
+            for filename, rel, stamp, place in stamped:
+                if place is None:
+                    place = next(parsed)
+                pc.add_place(place)
+                self._sources[rel] = (stamp, place)
+            yield pc
+        if (
+                self.cache is None
+                or set(self._sources.keys()) != set(self.cache.files.keys())):
+            self._unchanged = False
+
+    def _shard_key(self, path: str):
+        return splitext(path.rsplit('/', 1)[-1])[0]
+
+    def _record_shard_key(self, record: tuple):
+        return record_pid(record, self.decoder)
+
+    def _merge(self, results: list):
+        """Reuse the per-directory collections, extending the first one."""
+        if len(results) == 0:
+            return None
+        return results[0].extend(*results[1:])
+
+    def iter_places(self, count=True, workers=False, concurrency=False):
+        """Yield each Place in the tree as it is loaded."""
+        for pc in self.iter_batches(
+                count=count, workers=workers, concurrency=concurrency):
+            yield from pc.places
+
+    def _load(self, root, filenames):
+        data = super()._load(root, filenames)
+        if not self.compact:
+            return data
+        if self.bulk is not None:
+            return [
+                CompactPlace(
+                    datum, source=root, offset=offset, length=len(raw))
+                for (name, offset, raw), datum in zip(filenames, data)]
+        return [
+            CompactPlace(datum, source=join(root, filename))
+            for filename, datum in zip(filenames, data)]
 
     def _do(self, data: list):
         pc = PlaceCollection()
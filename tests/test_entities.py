@@ -5,8 +5,19 @@
 import json
 import logging
 from nose.tools import assert_equal, assert_false, assert_is_none, assert_true, raises
-from os.path import abspath, join, realpath
+from os.path import abspath, dirname, join, realpath
 from pleiades.walker import Place, PlaceCollection
+from pleiades.walker.entities import (
+    CompactPlace, NameSearchIndex, SpatialIndex, _trigrams, punct_table,
+    tokenize, tokenize_many)
+from pleiades.walker.database import PlaceDatabase
+from pleiades.walker.snapshot import Snapshot
+from pleiades.walker.stats import Stats
+import pickle
+from shutil import rmtree
+import subprocess
+import sys
+from tempfile import mkdtemp
 from unittest import TestCase
 
 logger = logging.getLogger(__name__)
@@ -101,3 +112,414 @@ class Test_Entities(TestCase):
     @raises(ValueError)
     def test_place_collection_add_bad(self):
         PlaceCollection('Heidelberg')
+
+    def test_place_collection_extend(self):
+        pc = PlaceCollection([test_d])
+        other = PlaceCollection([test_d])
+        pc.extend(other, [test_d, Place(test_d)])
+        assert_equal(len(pc.places), 4)
+        assert_true(pc.places[1] is other.places[0])
+
+    @raises(ValueError)
+    def test_place_collection_extend_bad(self):
+        PlaceCollection().extend(['Heidelberg'])
+
+    def test_place_collection_add(self):
+        pc = PlaceCollection([test_d]) + PlaceCollection([test_d])
+        assert_equal(len(pc.places), 2)
+
+    def test_place_collection_postings(self):
+        d = dict(test_d)
+        d['id'] = '12346'
+        pc = PlaceCollection([d, test_d])
+        pc.get('name', 'Unobtainium')
+        entry = pc.indices['name']['unobtainium']
+        assert_equal(list(entry), [0, 1])
+        assert_equal(pc.pids, ['12346', '12345'])
+        pc._index('name', pc.places[1])
+        assert_equal(list(entry), [0, 1])
+        pc.remove_places(['12346'])
+        assert_equal(list(entry), [1])
+        assert_equal(
+            [p.data['id'] for p in pc.get('name', 'Unobtainium')], ['12345'])
+
+    def test_place_collection_reuses_ordinals(self):
+        d = dict(test_d)
+        d['id'] = '12346'
+        pc = PlaceCollection([test_d, d], index_on_add=True)
+        for title in ['Unobtainium Major', 'Unobtainium Minor']:
+            changed = dict(test_d, title=title)
+            pc.update_places(remove=['12345'], add=[changed])
+        assert_equal(pc.pids, ['12345', '12346'])
+        assert_equal(
+            [p.id for p in pc.get('in_name', 'Minor')], ['12345'])
+        assert_equal(pc.get('in_name', 'Major'), [])
+        pc.remove_places(['12345'])
+        assert_equal([p.id for p in pc.get('name_prefix', 'unob')], ['12346'])
+
+    def test_place_collection_name_search(self):
+        d = dict(test_d)
+        d['id'] = '12346'
+        pc = PlaceCollection([d, test_d])
+        assert_equal(
+            [p.data['id'] for p in pc.get('name_prefix', 'unob')],
+            ['12346', '12345'])
+        pc.remove_places(['12346', '12345'])
+        assert_equal(pc.get('name_prefix', 'unob'), [])
+        assert_equal(pc.indices['name_search'].trigrams, {})
+
+    def test_name_search_similar(self):
+        index = NameSearchIndex()
+        # with some tokens whose trigrams repeat
+        words = [
+            'germania', 'germanicus', 'german', 'germ', 'armenia', 'roma',
+            'romania', 'aegermania', 'manila', 'g', 'mississippi',
+            'ddeeeedor', 'aaaa']
+        for n, word in enumerate(words):
+            index.add([word], n)
+        query = _trigrams('germania')
+        expected = sorted(
+            (-2.0 * len(query & _trigrams(w)) / (
+                len(query) + len(_trigrams(w))), w)
+            for w in words if len(query & _trigrams(w)) > 0)
+        for threshold in [0.0, 0.3, 0.5, 0.9]:
+            assert_equal(
+                index.similar('germania', threshold),
+                [(-s, w) for s, w in expected if -s >= threshold])
+        assert_equal(
+            index.similar('germania', 0.3, 3),
+            index.similar('germania', 0.3)[:3])
+        assert_equal(
+            index.similar('romania', 0.3, 2),
+            index.similar('romania', 0.3)[:2])
+        assert_equal(index.similar('romania', 0.3, 0), [])
+        grams = _trigrams('ddeeeedor')
+        assert_equal(
+            index.similar('ddi', 0.3),
+            [(2.0 * 2 / (len(grams) + 4), 'ddeeeedor')])
+        assert_equal(
+            index.similar('missisippi', 0.9), [(20.0 / 21, 'mississippi')])
+        # the limit counts places, however many similar tokens they have
+        pc = PlaceCollection()
+        pc.indices['name_search'] = index = NameSearchIndex()
+        index.add(['germania', 'germanias', 'germaniae'], 0)
+        index.add(['germ'], 1)
+        assert_equal(pc._match_name_fuzzy(('germania', 2)), [0, 1])
+
+    def test_spatial_nearest(self):
+        index = SpatialIndex(cell_size=0.5)
+        points = [
+            (10.0 + (n * 7 % 23) / 10.0, 40.0 + (n * 11 % 17) / 10.0)
+            for n in range(60)]
+        for n, (x, y) in enumerate(points):
+            index.add(n, x, y)
+        # inside the extent, beside it, and far outside it
+        for x, y in [(11.0, 41.0), (9.0, 40.5), (-100.0, -80.0),
+                     (170.0, 41.0)]:
+            expected = sorted(
+                range(len(points)),
+                key=lambda n: ((points[n][0] - x) ** 2 +
+                               (points[n][1] - y) ** 2, n))
+            for k in [1, 5, 60, 100]:
+                assert_equal(index.nearest(x, y, k), expected[:k])
+
+    def test_index_on_add(self):
+        calls = []
+
+        class Counting(PlaceCollection):
+            def _do_index_in_name(self, names, pid):
+                calls.append(pid)
+                super()._do_index_in_name(names, pid)
+        d = dict(test_d)
+        d['title'] = 'Mons Unobtainium Maior'
+        pc = Counting([d], index_on_add=True)
+        assert_equal(calls, ['12345'])
+        assert_equal(
+            [p.data['id'] for p in pc.get('in_name', 'Maior')], ['12345'])
+        assert_equal(
+            [p.data['id'] for p in pc.get('name', 'Mons Unobtainium Maior')],
+            ['12345'])
+
+    def test_build_indices(self):
+        pc = PlaceCollection([test_d])
+        assert_equal(pc.build_indices(['name', 'modified']), [
+            'name', 'modified'])
+        assert_equal(list(pc.indices['name'].keys()), ['unobtainium'])
+        assert_equal(pc.build_indices(['name']), [])
+
+    def _graph(self):
+        # 1 - 2 - 3 - 4, 1 - 5 - 4 and 2 - 6, with 7 alone and a link from 6
+        # to a place that is not in the collection
+        links = {
+            '1': ['2', 'https://pleiades.stoa.org/places/5'], '2': ['3'],
+            '3': ['4'], '4': [], '5': ['4'], '6': ['2', '99'], '7': []}
+        places = []
+        for pid, connects in sorted(links.items()):
+            d = dict(test_d)
+            d['id'] = pid
+            d['connectsWith'] = connects
+            places.append(d)
+        return PlaceCollection(places)
+
+    def test_place_collection_graph(self):
+        pc = self._graph()
+
+        def pids(it, value):
+            return [p.id for p in pc.get(it, value)]
+        assert_equal(pids('neighbors', '2'), ['1', '3', '6'])
+        assert_equal(
+            pids('neighbors', 'https://pleiades.stoa.org/places/4'),
+            ['3', '5'])
+        assert_equal(pids('neighbors', '7'), [])
+        assert_equal(pids('neighbors', '99'), [])
+        assert_equal(pids('hops', ('1', 1)), ['2', '5'])
+        assert_equal(pids('hops', ('1', 2)), ['2', '5', '3', '4', '6'])
+        assert_equal(pids('hops', ('7', 3)), [])
+        assert_equal(pids('path', ('6', '4')), ['6', '2', '3', '4'])
+        assert_equal(pids('path', ('1', '4')), ['1', '5', '4'])
+        assert_equal(pids('path', ('3', '3')), ['3'])
+        assert_equal(pids('path', ('1', '7')), [])
+        pc.remove_places(['5'])
+        assert_equal(pids('path', ('1', '4')), ['1', '2', '3', '4'])
+        assert_equal(pids('neighbors', '4'), ['3'])
+
+    def test_place_collection_graph_merge(self):
+        pc = self._graph()
+        pc.get('neighbors', '1')
+        first = PlaceCollection(pc.places[:3])
+        second = PlaceCollection(pc.places[3:])
+        first.get('neighbors', '1')
+        second.get('neighbors', '1')
+        merged = PlaceCollection().merge(first, second)
+        for value in ['1', '4', '6']:
+            assert_equal(
+                [p.id for p in merged.get('neighbors', value)],
+                [p.id for p in pc.get('neighbors', value)])
+        assert_equal(
+            [p.id for p in merged.get('path', ('6', '4'))],
+            ['6', '2', '3', '4'])
+
+    def test_place_collection_stats(self):
+        events = []
+        pc = PlaceCollection([test_d])
+        pc.stats.callback = lambda event, fields: events.append(
+            (event, fields))
+        pc.get('name', 'Unobtainium')
+        pc.get('name', 'Unobtainium')
+        assert_equal(pc.stats.counters['query.name'], 2)
+        assert_equal(pc.stats.gauges['entries.name'], 1)
+        assert_true(pc.stats.timers['build.name'] > 0)
+        assert_equal(
+            [(e, f['index']) for e, f in events],
+            [('build', 'id'), ('build', 'name')])
+
+    def test_compact_place(self):
+        fn = abspath(realpath(join(self.place_json_path, '1/0/1000.json')))
+        with open(fn, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        p = CompactPlace(j, source=fn)
+        assert_false(hasattr(p, 'references'))
+        assert_equal(p.id, '1000')
+        assert_equal(p.title, j['title'])
+        assert_equal(p.data, j)
+
+    def test_place_slots(self):
+        fn = abspath(realpath(join(self.place_json_path, '1/0/1000.json')))
+        with open(fn, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        for p in [Place(j), CompactPlace(j, source=fn)]:
+            assert_false(hasattr(p, '__dict__'))
+            copy = pickle.loads(pickle.dumps(p))
+            assert_equal(copy.id, '1000')
+            assert_equal(copy.data, j)
+        pc = PlaceCollection([CompactPlace(j, source=fn)])
+        assert_equal(pc.get('id', '1000')[0].title, j['title'])
+
+    @raises(ValueError)
+    def test_compact_place_bad_type(self):
+        CompactPlace({'@type': 'Knuckle'}, source='nowhere.json')
+
+
+class Test_Stats(TestCase):
+
+    def test_stats(self):
+        stats = Stats()
+        stats.count('files', 2)
+        stats.count('files')
+        stats.add_time('load', 0.5)
+        stats.set('entries.name', 7)
+        assert_equal(stats.rate('files', 'load'), 6.0)
+        assert_is_none(stats.rate('files', 'decode'))
+        with stats.timer('clean'):
+            pass
+        assert_equal(list(stats.iterate('list', [1, 2])), [1, 2])
+        assert_equal(
+            sorted(stats.as_dict()['timers'].keys()), ['clean', 'list', 'load'])
+
+    def test_stats_merge_pickle(self):
+        stats = Stats(callback=lambda event, fields: None)
+        stats.count('files', 2)
+        copy = pickle.loads(pickle.dumps(stats))
+        assert_is_none(copy.callback)
+        copy.merge(stats)
+        assert_equal(copy.counters, {'files': 4})
+
+    def test_stats_callback_error(self):
+        def fail(event, fields):
+            raise RuntimeError(event)
+        Stats(callback=fail).emit('walk', {})
+
+
+class Test_Tokenize(TestCase):
+
+    def test_tokenize(self):
+        assert_equal(tokenize(' Forum Iulii (?) '), 'forumiulii')
+        assert_equal(tokenize('Ἀθῆναι'), 'athenai')
+
+    def test_tokenize_cached(self):
+        tokenize.cache_clear()
+        tokenize('Actania')
+        tokenize('Actania')
+        assert_equal(tokenize.cache_info().hits, 1)
+
+    def test_tokenize_many(self):
+        assert_equal(
+            tokenize_many(['Roma', 'roma', 'Roma', 'Ostia']),
+            {'roma', 'ostia'})
+
+
+class Test_Import(TestCase):
+
+    def test_punct_table(self):
+        assert_equal('Ad Fines, (?)'.translate(punct_table), 'Ad Fines ')
+        assert_true(ord('(') in punct_table)
+
+    def test_import_time(self):
+        """Importing entities stays cheap: no tables built, no dateutil.
+
+        The time taken is only logged, as it depends on the machine.
+        """
+        script = (
+            'import sys, time\n'
+            't = time.perf_counter()\n'
+            'import pleiades.walker.entities as e\n'
+            't = time.perf_counter() - t\n'
+            'print(t, len(e.punct_table), "dateutil" in sys.modules)\n')
+        out = subprocess.run(
+            [sys.executable, '-c', script], check=True,
+            cwd=dirname(dirname(abspath(__file__))),
+            stdout=subprocess.PIPE, universal_newlines=True).stdout
+        seconds, table_size, dateutil_loaded = out.split()
+        logger.info('entities import time: {} s'.format(seconds))
+        assert_equal(table_size, '0')
+        assert_equal(dateutil_loaded, 'False')
+
+
+class Test_Snapshot(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = join(self.tmp_dir, 'places.snapshot')
+        d = dict(test_d)
+        d['id'] = '12346'
+        d['title'] = 'Unobtainium Minor'
+        self.pc = PlaceCollection([test_d, d])
+        assert_equal(self.pc.export_snapshot(self.path), 2)
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_snapshot_get(self):
+        with Snapshot(self.path) as snap:
+            assert_equal(len(snap), 2)
+            for it, value in [
+                    ('id', '12346'), ('id', '99'), ('name', 'unobtainium'),
+                    ('name', 'Unobtainium Minor'), ('name', 'Zzz'),
+                    ('in_name', 'Minor'), ('last_modified', None)]:
+                assert_equal(
+                    [p.data for p in snap.get(it, value)],
+                    [p.data for p in self.pc.get(it, value)])
+
+    @raises(ValueError)
+    def test_snapshot_bad_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot')
+        del f
+        Snapshot(self.path)
+
+
+class Test_Database(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = join(self.tmp_dir, 'places.sqlite')
+        d = dict(test_d)
+        d['id'] = '12346'
+        d['title'] = 'Unobtainium Minor'
+        self.pc = PlaceCollection([test_d, d])
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def _check(self, database, pc, queries):
+        for it, value in queries:
+            assert_equal(
+                [p.data for p in database.get(it, value)],
+                [p.data for p in pc.get(it, value)])
+
+    def test_database_get(self):
+        queries = [
+            ('id', '12346'), ('id', '99'), ('name', 'unobtainium'),
+            ('name', 'Unobtainium Minor'), ('name', 'Zzz'),
+            ('in_name', 'Minor'), ('in_name', 'Min'),
+            ('last_modified', None)]
+        with PlaceDatabase(self.path) as database:
+            assert_equal(database.load(self.pc), 2)
+            assert_equal(len(database), 2)
+            self._check(database, self.pc, queries)
+        # reopened, and reloaded without duplicating places
+        with PlaceDatabase(self.path) as database:
+            assert_equal(len(database), 2)
+            self._check(database, self.pc, queries)
+            database.load(self.pc.places[:1])
+            assert_equal(len(database), 2)
+            database.remove_places(['12345'])
+            assert_equal(len(database), 1)
+            assert_equal(database.get('name', 'unobtainium'), [])
+
+    def test_database_duplicates(self):
+        d = dict(test_d)
+        d['title'] = 'Unobtainium Major'
+        with PlaceDatabase(self.path) as database:
+            database.load(self.pc.places + [Place(d)])
+            assert_equal(len(database), 2)
+            assert_equal(
+                database.get('id', '12345')[0].title, 'Unobtainium Major')
+            assert_equal(
+                [p.id for p in database.get('in_name', 'Major')], ['12345'])
+            # and across batches
+            database.load([Place(test_d), Place(d), Place(test_d)], 2)
+            assert_equal(len(database), 2)
+            assert_equal(database.get('id', '12345')[0].title, 'Unobtainium')
+            assert_equal(database.get('in_name', 'Major'), [])
+
+    def test_database_walker(self):
+        from pleiades.walker import PleiadesWalker
+        path = abspath(realpath(join(*place_json_path)))
+        count, pc = PleiadesWalker(path=path).walk()
+        with PlaceDatabase(self.path) as database:
+            assert_equal(
+                database.load(PleiadesWalker(path=path), batch_size=4),
+                count)
+            self._check(database, pc, [
+                ('id', '1000'), ('name', 'Germania Superior'),
+                ('name', 'Actania'), ('in_name', 'Superior'),
+                ('in_name', 'Germania'), ('last_modified', None)])
+            assert_equal(database.most_recent, pc.most_recent)
+
+    @raises(ValueError)
+    def test_database_bad_index(self):
+        with PlaceDatabase(self.path) as database:
+            database.get('bbox', (0, 0, 1, 1))
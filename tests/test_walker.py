@@ -2,13 +2,33 @@
 # -*- coding: utf-8 -*-
 """Test the place_crawler module."""
 
+from datetime import datetime
+import gzip
+import json
 import logging
-from nose.tools import assert_equal, assert_false, assert_is_none, assert_true, raises
+from nose.tools import (
+    assert_equal, assert_false, assert_is_none, assert_raises, assert_true,
+    raises)
+from os import remove
 from os.path import abspath, join, realpath
+import pickle
 from pleiades.walker import Walker, JsonWalker, PlaceCollection, PleiadesWalker
-from unittest import TestCase
+from pleiades.walker.bulk import pack
+from pleiades.walker.columnar import export_columns, read_columns
+from pleiades.walker.decoders import available_decoders
+from pleiades.walker.entities import CompactPlace, INDEX_KEYS
+from pleiades.walker import query
+from pleiades.walker.query import Q
+from shutil import copytree, rmtree
+import tarfile
+from tempfile import mkdtemp
+from unittest import TestCase, skipUnless
 
 logger = logging.getLogger(__name__)
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 test_data_path = ['tests', 'data']
 place_json_path = test_data_path
 place_json_path.append('place_json')
@@ -57,6 +77,78 @@ class Test_Basics(TestCase):
         w = JsonWalker(path=self.place_json_path)
         count, result = w.walk()
 
+    def test_json_walker_decoders(self):
+        root = join(self.place_json_path, '1', '0')
+        expected = None
+        for decoder in available_decoders():
+            w = JsonWalker(path=self.place_json_path, decoder=decoder)
+            data = w._load(root, ['1000.json'])
+            if expected is None:
+                expected = data
+            assert_equal(data, expected)
+            assert_equal(data[0]['id'], '1000')
+
+    @raises(ValueError)
+    def test_json_walker_bad_decoder(self):
+        JsonWalker(path=self.place_json_path, decoder='yaml')
+
+    def test_json_walker_keys(self):
+        w = PleiadesWalker(path=self.place_json_path, keys=INDEX_KEYS)
+        count, pc = w.walk()
+        assert_equal(
+            sorted(pc.get('id', '1000')[0].data.keys()), sorted(INDEX_KEYS))
+        assert_equal(pc.get('name', 'Actania')[0].id, '101172')
+
+    def test_json_walker_intern(self):
+        count, expected = PleiadesWalker(path=self.place_json_path).walk()
+        for workers in [2, 1]:
+            w = PleiadesWalker(path=self.place_json_path, intern=True)
+            count, pc = w.walk(workers=workers)
+            assert_equal(
+                [p.data for p in pc.places],
+                [p.data for p in expected.places])
+            assert_true(w.stats.counters['interned'] > 0)
+            assert_true(w.stats.counters['interned_bytes'] > 0)
+        first = pc.get('id', '1000')[0].data
+        second = pc.get('id', '200082')[0].data
+        assert_true(first['rights'] is second['rights'])
+        assert_true(first['contributors'][-1] is second['contributors'][2])
+        assert_true(first['creators'][2] is second['contributors'][0])
+        # shared records are read-only, and empty ones are not shared
+        record = first['contributors'][-1]
+        for change in [
+                lambda: record.update(name='Nobody'),
+                lambda: record.pop('name'),
+                lambda: first['placeTypes'].append('settlement')]:
+            assert_raises(TypeError, change)
+        assert_equal(json.loads(json.dumps(first)), first)
+        copy = pickle.loads(pickle.dumps(record))
+        assert_equal(copy, record)
+        assert_equal(type(copy), type(record))
+        empty = [p.data['connectsWith'] for p in pc.places
+                 if p.data.get('connectsWith') == []]
+        assert_true(len(empty) > 1)
+        assert_false(empty[0] is empty[1])
+        empty[0].append('1000')
+
+    def test_walker_parallel(self):
+        w = Walker(path=self.place_json_path, workers=2)
+        count, result = w.walk()
+        assert_equal(count, 13)
+        assert_is_none(result)
+
+    def test_walker_concurrent(self):
+        class Lister(Walker):
+            LOAD_CHUNK_SIZE = 1
+
+            def _do(self, data):
+                return data
+        serial = Lister(path=self.place_json_path).walk()
+        w = Lister(path=self.place_json_path, concurrency=4)
+        assert_equal(w.walk(), serial)
+        assert_equal(
+            Lister(path=self.place_json_path).walk(concurrency=3), serial)
+
 
 class Test_Indexing(TestCase):
 
@@ -75,6 +167,206 @@ class Test_Indexing(TestCase):
         assert_equal(self.count, 11)
         assert_equal(type(self.pc), PlaceCollection)
 
+    def test_pleiades_walker_parallel(self):
+        w = PleiadesWalker(path=self.place_json_path)
+        count, pc = w.walk(workers=2)
+        assert_equal(count, self.count)
+        assert_equal(
+            [p.data['id'] for p in pc.places],
+            [p.data['id'] for p in self.pc.places])
+
+    def test_pleiades_walker_concurrent(self):
+        w = PleiadesWalker(path=self.place_json_path, concurrency=4)
+        count, pc = w.walk()
+        assert_equal(count, self.count)
+        assert_equal(
+            [p.data['id'] for p in pc.places],
+            [p.data['id'] for p in self.pc.places])
+
+    def test_stats(self):
+        events = []
+        w = PleiadesWalker(path=self.place_json_path)
+        w.stats.callback = lambda event, fields: events.append(
+            (event, fields))
+        count, pc = w.walk()
+        counters = w.stats.counters
+        assert_equal(counters['files'], self.count)
+        assert_true(counters['bytes'] > 0)
+        for timer in ['list', 'load', 'read', 'decode', 'do', 'walk']:
+            assert_true(timer in w.stats.timers)
+        assert_equal([e for e, f in events], ['walk'])
+        assert_equal(events[0][1]['counters']['files'], self.count)
+        pc.get('name', 'Actania')
+        assert_equal([e for e, f in events][-1], 'build')
+
+    def test_stats_parallel(self):
+        for options in [{'workers': 2}, {'concurrency': 4}]:
+            w = PleiadesWalker(path=self.place_json_path)
+            w.walk(**options)
+            assert_equal(w.stats.counters['files'], self.count)
+            assert_true(w.stats.timers['decode'] > 0)
+
+    def test_build_indices(self):
+        self.pc.build_indices()
+        for workers in [1, 2]:
+            count, pc = PleiadesWalker(path=self.place_json_path).walk()
+            built = pc.build_indices(workers=workers)
+            assert_true('in_name' in built)
+            assert_equal(pc.most_recent, self.pc.most_recent)
+            for it in ['name', 'in_name', 'last_modified', 'placeTypes']:
+                assert_equal(pc.indices[it], self.pc.indices[it])
+            for it in ['name', 'in_name']:
+                assert_equal(
+                    [p.id for p in pc.get(it, 'Superior')],
+                    [p.id for p in self.pc.get(it, 'Superior')])
+            assert_equal(
+                [p.id for p in pc.get('modified_since', '2013-01-01')],
+                [p.id for p in self.pc.get('modified_since', '2013-01-01')])
+            assert_equal(
+                [p.id for p in pc.get('nearest', (14.0, 46.0, 5))],
+                [p.id for p in self.pc.get('nearest', (14.0, 46.0, 5))])
+            assert_equal(
+                [p.id for p in pc.get('name_fuzzy', 'Germana')],
+                [p.id for p in self.pc.get('name_fuzzy', 'Germana')])
+
+    def test_shards(self):
+        for n in [1, 3]:
+            pids = []
+            for i in range(n):
+                w = PleiadesWalker(path=self.place_json_path, shard=(i, n))
+                count, pc = w.walk()
+                assert_equal(count, len(pc.places) if pc else 0)
+                pids.extend([p.id for p in pc.places] if pc else [])
+                again = PleiadesWalker(path=self.place_json_path, shard=(i, n))
+                assert_equal(again.walk()[0], count)
+            assert_equal(
+                sorted(pids), sorted([p.id for p in self.pc.places]))
+
+    @raises(ValueError)
+    def test_bad_shard(self):
+        PleiadesWalker(path=self.place_json_path, shard=(3, 3))
+
+    def _shards(self, n):
+        return [
+            PleiadesWalker(path=self.place_json_path, shard=(i, n)).walk()[1]
+            for i in range(n)]
+
+    def test_merge(self):
+        self.pc.build_indices()
+        shards = self._shards(3)
+        for shard in shards:
+            shard.build_indices()
+        pc = PlaceCollection().merge(*shards)
+        assert_equal(
+            sorted([p.id for p in pc.places]),
+            sorted([p.id for p in self.pc.places]))
+        assert_equal(pc.most_recent, self.pc.most_recent)
+        for it in pc.indices:
+            assert_equal(len(pc.indices[it]), len(self.pc.indices[it]))
+        for it, value in [
+                ('name', 'Germania Superior'), ('in_name', 'Superior'),
+                ('last_modified', None), ('placeTypes', 'province'),
+                ('modified_since', '2013-01-01'),
+                ('bbox', (0.0, 40.0, 20.0, 55.0)),
+                ('nearest', (14.0, 46.0, 11)), ('name_prefix', 'germ'),
+                ('name_fuzzy', 'Germana')]:
+            assert_equal(
+                sorted([p.id for p in pc.get(it, value)]),
+                sorted([p.id for p in self.pc.get(it, value)]))
+
+    def test_merge_unbuilt(self):
+        self.pc.build_indices()
+        shards = self._shards(2)
+        shards[0].build_indices(['spatial', 'placeTypes'])
+        pc = shards[1].merge(shards[0])
+        assert_equal(len(pc.places), self.count)
+        for it in ['id', 'spatial', 'placeTypes']:
+            assert_equal(len(pc.indices[it]), len(self.pc.indices[it]))
+        assert_equal(len(pc.indices['in_name']), 0)
+        assert_equal(
+            [p.id for p in pc.get('in_name', 'Superior')],
+            [p.id for p in self.pc.get('in_name', 'Superior')])
+        shards = self._shards(2)
+        pc = PlaceCollection(index_on_add=True).merge(*shards)
+        for it in pc.indices:
+            assert_equal(len(pc.indices[it]), len(self.pc.indices[it]))
+
+    def test_iter_batches(self):
+        w = PleiadesWalker(path=self.place_json_path)
+        batches = list(w.iter_batches())
+        assert_equal(w.count, self.count)
+        assert_true(all(type(b) == PlaceCollection for b in batches))
+        assert_equal(sum([len(b.places) for b in batches]), self.count)
+
+    def test_iter_places(self):
+        w = PleiadesWalker(path=self.place_json_path)
+        for workers in [1, 2]:
+            pids = [p.data['id'] for p in w.iter_places(workers=workers)]
+            assert_equal(pids, [p.data['id'] for p in self.pc.places])
+
+    def test_modified_since_inclusive(self):
+        places = self.pc.get('modified_since', '2013-12-29T17:03:26Z')
+        assert_equal([p.id for p in places], ['200087', '200084'])
+
+    def test_modified_since(self):
+        assert_equal(self.pc.get('modified_since', '2015-01-01'), [])
+        places = self.pc.get('modified_since', datetime(2013, 9, 15))
+        assert_equal(
+            [p.id for p in places],
+            ['200082', '200083', '200087', '200084'])
+
+    def test_modified_between(self):
+        places = self.pc.get(
+            'modified_between', ('2012-02-15', '2012-02-15T02:48:37Z'))
+        assert_equal([p.id for p in places], ['200081', '200085'])
+        places = self.pc.get(
+            'modified_between', (None, '2012-02-15T02:48:35+00:00'))
+        assert_equal([p.id for p in places], ['200081'])
+
+    def test_bbox(self):
+        places = self.pc.get('bbox', (13.0, 45.0, 14.0, 46.0))
+        assert_equal(sorted([p.id for p in places]), ['200082', '200083'])
+        assert_equal(self.pc.get('bbox', (-10.0, -10.0, 0.0, 0.0)), [])
+        places = self.pc.get('bbox', (-180.0, -90.0, 180.0, 90.0))
+        assert_equal(len(places), 10)
+
+    def test_nearest(self):
+        places = self.pc.get('nearest', (7.0, 47.0))
+        assert_equal([p.id for p in places], ['1000'])
+        places = self.pc.get('nearest', (14.9, 47.5, 2))
+        assert_equal([p.id for p in places], ['200086', '200085'])
+        places = self.pc.get('nearest', (100.0, -40.0, 20))
+        assert_equal(len(places), 10)
+        assert_equal(places[-1].id, '1000')
+
+    def test_name_prefix(self):
+        places = self.pc.get('name_prefix', 'germ')
+        assert_equal([p.id for p in places], ['1000'])
+        places = self.pc.get('name_prefix', 'Acta')
+        assert_equal([p.id for p in places], ['101172'])
+        assert_equal(self.pc.get('name_prefix', 'zzz'), [])
+
+    def test_name_fuzzy(self):
+        places = self.pc.get('name_fuzzy', 'Actanai')
+        assert_equal(places[0].id, '101172')
+        places = self.pc.get('name_fuzzy', ('germania sup', 1))
+        assert_equal([p.id for p in places], ['1000'])
+        assert_equal(self.pc.get('name_fuzzy', 'qqqq'), [])
+
+    def test_compact(self):
+        w = PleiadesWalker(path=self.place_json_path, compact=True)
+        count, pc = w.walk()
+        assert_equal(count, self.count)
+        assert_true(all(type(p) == CompactPlace for p in pc.places))
+        assert_equal(
+            [p.id for p in pc.get('name', 'Actania')],
+            [p.id for p in self.pc.get('name', 'Actania')])
+        assert_equal(
+            [p.id for p in pc.get('last_modified')],
+            [p.id for p in self.pc.get('last_modified')])
+        place = pc.get('id', '1000')[0]
+        assert_equal(place.data, self.pc.get('id', '1000')[0].data)
+
     def test_by_id(self):
         place = self.pc.get('id', '1000')[0]
         assert_equal(
@@ -101,3 +393,422 @@ class Test_Indexing(TestCase):
         places = self.pc.get('last_modified')
         assert_equal(len(places), 1)
         assert_equal(places[0].data['id'], '200084')
+
+
+class Test_Query(TestCase):
+
+    def setUp(self):
+        global place_json_path
+        self.place_json_path = abspath(realpath(join(*place_json_path)))
+        w = PleiadesWalker(path=self.place_json_path)
+        self.count, self.pc = w.walk()
+
+    def test_attribute_indices(self):
+        assert_equal(
+            [p.id for p in self.pc.get('placeTypes', 'mine')],
+            ['200083', '200084', '200087', '200086', '200082'])
+        assert_equal(
+            [p.id for p in self.pc.get('subject', 'iron')], ['200086'])
+        assert_equal(
+            len(self.pc.get('review_state', 'published')), self.count)
+        assert_equal(self.pc.get('placeTypes', 'temple'), [])
+
+    def test_and_not(self):
+        q = Q('placeTypes', 'mine') & ~Q('subject', 'iron')
+        assert_equal(
+            self.pc.query(q).ids(), ['200083', '200084', '200087', '200082'])
+
+    def test_or(self):
+        q = (
+            (Q('placeTypes', 'mine') | Q('placeTypes', 'province'))
+            & Q('bbox', (7.0, 45.0, 14.0, 48.0)))
+        assert_equal(self.pc.query(q).ids(), ['200083', '200082', '1000'])
+
+    def test_not(self):
+        result = self.pc.query(~Q('placeTypes', 'quarry'))
+        assert_equal(len(result), 7)
+        assert_false('200089' in result.ids())
+
+    def test_limit_offset(self):
+        q = Q('placeTypes', 'mine')
+        result = self.pc.query(q, limit=2, offset=1)
+        assert_equal(result.ids(), ['200084', '200087'])
+        assert_equal([p.id for p in result], ['200084', '200087'])
+        assert_equal(result[0].id, '200084')
+
+    def test_lazy(self):
+        result = self.pc.query(Q('in_name', 'superior'))
+        assert_is_none(result._ordinals)
+        assert_equal(result.ids(), ['1000'])
+
+    def test_filters(self):
+        q = (
+            Q('placeTypes', 'mine') & Q('modified_since', '2013-09-15')
+            & Q('bbox', (13.0, 45.0, 14.0, 46.0)))
+        expected = ['200083', '200082']
+        assert_equal(self.pc.query(q).ids(), expected)
+        ratio = query.FILTER_RATIO
+        query.FILTER_RATIO = 0
+        try:
+            assert_equal(self.pc.query(q).ids(), expected)
+        finally:
+            query.FILTER_RATIO = ratio
+
+    @raises(ValueError)
+    def test_bad_query(self):
+        self.pc.query(('name', 'Actania')).ids()
+
+
+class Test_Cache(TestCase):
+
+    def setUp(self):
+        """Setup steps to run before each place_crawler test."""
+        global place_json_path
+        self.place_json_path = abspath(realpath(join(*place_json_path)))
+        self.tmp_dir = mkdtemp()
+        self.data_path = join(self.tmp_dir, 'place_json')
+        copytree(self.place_json_path, self.data_path)
+        self.cache_path = join(self.tmp_dir, 'cache.pickle')
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_cold_cache(self):
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, pc = w.walk()
+        assert_equal(count, 11)
+        assert_false(w._unchanged)
+
+    def test_warm_cache(self):
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, pc = w.walk()
+        pc.get('name', 'Actania')
+        w.save_cache(pc)
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, warm = w.walk()
+        assert_equal(count, 11)
+        assert_true(w._unchanged)
+        assert_equal(
+            [p.data['id'] for p in warm.places],
+            [p.data['id'] for p in pc.places])
+        assert_equal(warm.indices['name'], pc.indices['name'])
+        assert_equal(warm.get('name', 'Actania')[0].data['id'], '101172')
+
+    def test_cache_invalidation(self):
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, pc = w.walk()
+        pc.get('name', 'Actania')
+        w.save_cache(pc)
+        fn = join(self.data_path, '1', '0', '1000.json')
+        with open(fn, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        j['title'] = 'Germania Inferior'
+        with open(fn, 'w', encoding='utf-8') as f:
+            json.dump(j, f)
+        del f
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, pc = w.walk()
+        assert_false(w._unchanged)
+        assert_equal(pc.get('id', '1000')[0].data['title'], 'Germania Inferior')
+        assert_equal(
+            pc.get('name', 'Germania Inferior')[0].data['id'], '1000')
+
+    def test_cache_restored_twice(self):
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, pc = w.walk()
+        pc.get('name', 'Actania')
+        w.save_cache(pc)
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, a = w.walk()
+        count, b = w.walk()
+        assert_false(a.indices['name'] is b.indices['name'])
+        assert_false(a.pids is b.pids)
+        fn = join(self.data_path, '1', '0', '1000.json')
+        with open(fn, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        j['title'] = 'Germania Inferior'
+        with open(fn, 'w', encoding='utf-8') as f:
+            json.dump(j, f)
+        del f
+        w.update(a)
+        assert_equal(
+            [p.id for p in a.get('name', 'Germania Inferior')], ['1000'])
+        assert_equal(b.get('name', 'Germania Inferior'), [])
+
+    def test_stale_cache(self):
+        w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+        count, pc = w.walk()
+        w.save_cache(pc)
+        with open(self.cache_path, 'rb') as f:
+            header = f.readline()
+            key = pickle.load(f)
+        del f
+        for content in [
+                # written before the header, or by another version
+                pickle.dumps({'version': 9, 'files': {}}),
+                header.replace(b' ', b'  '),
+                # unpickling fails other than with an UnpicklingError
+                header + pickle.dumps(key) + pickle.dumps(
+                    Test_Cache).replace(b'Test_Cache', b'Test_Gone_')]:
+            with open(self.cache_path, 'wb') as f:
+                f.write(content)
+            del f
+            w = PleiadesWalker(path=self.data_path, cache=self.cache_path)
+            assert_equal(w.cache.files, {})
+            count, pc = w.walk()
+            assert_equal(count, 11)
+            assert_false(w._unchanged)
+
+
+class Test_Incremental(TestCase):
+
+    def setUp(self):
+        """Setup steps to run before each place_crawler test."""
+        global place_json_path
+        self.place_json_path = abspath(realpath(join(*place_json_path)))
+        self.tmp_dir = mkdtemp()
+        self.data_path = join(self.tmp_dir, 'place_json')
+        copytree(self.place_json_path, self.data_path)
+        self.w = PleiadesWalker(path=self.data_path, incremental=True)
+        self.count, self.pc = self.w.walk()
+        self.pc.get('name', 'Actania')
+        self.pc.get('last_modified')
+        self.pc.get('modified_since', '1970-01-01')
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    @raises(ValueError)
+    def test_update_not_incremental(self):
+        w = PleiadesWalker(path=self.data_path)
+        count, pc = w.walk()
+        w.update(pc)
+
+    def test_update_unchanged(self):
+        count, pc = self.w.update(self.pc)
+        assert_true(pc is self.pc)
+        assert_equal(count, 11)
+        assert_equal(
+            self.w.changes, {'added': [], 'modified': [], 'deleted': []})
+
+    def test_update_changes(self):
+        fn = join(self.data_path, '1', '0', '1000.json')
+        with open(fn, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        j['title'] = 'Germania Inferior'
+        j['names'] = []
+        with open(fn, 'w', encoding='utf-8') as f:
+            json.dump(j, f)
+        del f
+        remove(join(self.data_path, '2', '0', '0', '0', '200084.json'))
+        j['id'] = '1001'
+        with open(join(self.data_path, '1', '0', '1001.json'), 'w') as f:
+            json.dump(j, f)
+        del f
+        count, pc = self.w.update(self.pc)
+        assert_equal(count, 11)
+        assert_equal(self.w.changes, {
+            'added': [join('1', '0', '1001.json')],
+            'modified': [join('1', '0', '1000.json')],
+            'deleted': [join('2', '0', '0', '0', '200084.json')]})
+        assert_equal(len(pc.places), 11)
+        assert_equal(pc.get('id', '200084'), [])
+        assert_equal(
+            sorted([p.data['id'] for p in pc.get('name', 'Germania Inferior')]),
+            ['1000', '1001'])
+        assert_equal(pc.get('name', 'Germania Superior'), [])
+        assert_true('200084' not in [p.data['id'] for p in pc.get('last_modified')])
+        assert_equal(
+            sorted([p.id for p in pc.get('modified_since', '1970-01-01')]),
+            sorted([p.id for p in pc.places]))
+
+
+class Test_Bulk(TestCase):
+
+    def setUp(self):
+        """Setup steps to run before each place_crawler test."""
+        global place_json_path
+        self.place_json_path = abspath(realpath(join(*place_json_path)))
+        self.tmp_dir = mkdtemp()
+        w = PleiadesWalker(path=self.place_json_path)
+        self.count, self.pc = w.walk()
+        self.pids = sorted([p.id for p in self.pc.places])
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def _check(self, path, **kwargs):
+        w = PleiadesWalker(path=path, **kwargs)
+        count, pc = w.walk()
+        assert_equal(count, self.count)
+        assert_equal(sorted([p.id for p in pc.places]), self.pids)
+        assert_equal(pc.get('name', 'Actania')[0].id, '101172')
+        return pc
+
+    def test_jsonl(self):
+        path = join(self.tmp_dir, 'places.jsonl')
+        assert_equal(pack(self.place_json_path, path), self.count)
+        self._check(path)
+        self._check(path, workers=2)
+
+    def test_jsonl_compact(self):
+        path = join(self.tmp_dir, 'places.jsonl')
+        pack(self.place_json_path, path)
+        pc = self._check(path, compact=True)
+        assert_equal(
+            pc.get('id', '1000')[0].data, self.pc.get('id', '1000')[0].data)
+
+    def test_jsonl_gz(self):
+        path = join(self.tmp_dir, 'places.jsonl.gz')
+        pack(self.place_json_path, path)
+        self._check(path)
+
+    @raises(ValueError)
+    def test_jsonl_gz_compact(self):
+        path = join(self.tmp_dir, 'places.jsonl.gz')
+        pack(self.place_json_path, path)
+        PleiadesWalker(path=path, compact=True)
+
+    def test_dump(self):
+        path = join(self.tmp_dir, 'pleiades-places.json.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({'@graph': [p.data for p in self.pc.places]}, f)
+        del f
+        self._check(path)
+
+    def test_tar(self):
+        for name, mode in [('places.tar', 'w'), ('places.tar.gz', 'w:gz')]:
+            path = join(self.tmp_dir, name)
+            with tarfile.open(path, mode) as t:
+                t.add(self.place_json_path, arcname='json')
+            del t
+            self._check(path)
+        pc = self._check(join(self.tmp_dir, 'places.tar'), compact=True)
+        assert_equal(
+            pc.get('id', '1000')[0].data, self.pc.get('id', '1000')[0].data)
+
+    def test_jsonl_shards(self):
+        path = join(self.tmp_dir, 'places.jsonl')
+        pack(self.place_json_path, path)
+        pids = []
+        for i in range(2):
+            count, pc = PleiadesWalker(path=path, shard=(i, 2)).walk()
+            assert_equal(count, len(pc.places))
+            pids.extend([p.id for p in pc.places])
+        assert_equal(sorted(pids), self.pids)
+
+    def test_shards_by_pid(self):
+        path = join(self.tmp_dir, 'places.jsonl')
+        pack(self.place_json_path, path)
+        with open(path, 'rb') as f:
+            lines = f.readlines()
+        del f
+        # shards hold the same places from a tree, a tar archive or a
+        # '.jsonl' file, whether or not pack() wrote it and whatever records
+        # precede them
+        tar_path = join(self.tmp_dir, 'places.tar')
+        with tarfile.open(tar_path, 'w') as archive:
+            archive.add(self.place_json_path, arcname='json')
+        del archive
+        plain_path = join(self.tmp_dir, 'plain.jsonl')
+        with open(plain_path, 'wb') as f:
+            for line in lines[1:]:
+                # with 'id' last, as pack() would not write it
+                datum = json.loads(line)
+                datum['id'] = datum.pop('id')
+                f.write(json.dumps(datum).encode('utf-8') + b'\n')
+        del f
+        for i in range(3):
+            shards = [
+                sorted([p.id for p in PleiadesWalker(
+                    path=source, shard=(i, 3)).walk()[1].places])
+                for source in [self.place_json_path, path, tar_path]]
+            assert_equal(shards[1], shards[0])
+            assert_equal(shards[2], shards[0])
+            pc = PleiadesWalker(path=plain_path, shard=(i, 3)).walk()[1]
+            assert_equal(
+                sorted([p.id for p in pc.places]),
+                [pid for pid in shards[0] if pid != json.loads(lines[0])['id']])
+
+    @raises(ValueError)
+    def test_bulk_incremental(self):
+        path = join(self.tmp_dir, 'places.jsonl')
+        pack(self.place_json_path, path)
+        PleiadesWalker(path=path, incremental=True)
+
+
+class Test_Columnar(TestCase):
+
+    def setUp(self):
+        """Setup steps to run before each place_crawler test."""
+        global place_json_path
+        self.place_json_path = abspath(realpath(join(*place_json_path)))
+        self.tmp_dir = mkdtemp()
+        self.count, self.pc = PleiadesWalker(path=self.place_json_path).walk()
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_numpy(self):
+        w = PleiadesWalker(path=self.place_json_path)
+        count = export_columns(w, self.tmp_dir, 'numpy', batch_size=4)
+        assert_equal(count, self.count)
+        places = read_columns(self.tmp_dir, 'places')
+        assert_equal(
+            sorted(places['id']), sorted([p.id for p in self.pc.places]))
+        assert_equal(len(places['x']), count)
+        names = read_columns(self.tmp_dir, 'names')
+        assert_true('Germania Superior' in names['romanized'])
+        assert_equal(len(names['place_id']), len(names['start']))
+        place_types = read_columns(self.tmp_dir, 'place_types')
+        assert_equal(
+            sorted(place_types['placeType']),
+            sorted([t for p in self.pc.places for t in p.placeTypes]))
+
+    def test_collection(self):
+        count = self.pc.export_columns(self.tmp_dir, format='numpy')
+        assert_equal(count, self.count)
+        i = read_columns(self.tmp_dir, 'places')['id'].index('1000')
+        place = self.pc.get('id', '1000')[0]
+        assert_equal(
+            read_columns(self.tmp_dir, 'places')['modified'][i],
+            self.pc._latest_stamp(place))
+
+    @raises(ValueError)
+    def test_unknown_format(self):
+        export_columns(self.pc, self.tmp_dir, 'csv')
+
+    @skipUnless(pyarrow is not None, 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+        export_columns(self.pc, self.tmp_dir, 'parquet')
+        table = pyarrow.parquet.read_table(
+            join(self.tmp_dir, 'places.parquet'))
+        assert_equal(table.num_rows, self.count)
+        export_columns(self.pc, self.tmp_dir, 'arrow')
+        with pyarrow.ipc.open_file(join(self.tmp_dir, 'names.arrow')) as f:
+            table = f.read_all()
+        assert_true(
+            'Germania Superior' in table.column('romanized').to_pylist())
+
+    @skipUnless(pyarrow is not None, 'pyarrow is not installed')
+    def test_empty_tables(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+        pc = PlaceCollection([
+            dict(p.data, placeTypes=[], locations=[]) for p in self.pc.places])
+        export_columns(pc, self.tmp_dir, 'parquet')
+        for name in ['place_types', 'locations']:
+            table = pyarrow.parquet.read_table(
+                join(self.tmp_dir, '{}.parquet'.format(name)))
+            assert_equal(table.num_rows, 0)
+        export_columns(pc, self.tmp_dir, 'arrow')
+        with pyarrow.ipc.open_file(
+                join(self.tmp_dir, 'place_types.arrow')) as f:
+            table = f.read_all()
+        assert_equal(table.num_rows, 0)
+        assert_equal(table.column_names, ['place_id', 'placeType'])